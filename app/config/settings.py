@@ -23,6 +23,14 @@ class Settings(BaseSettings):
     llm_base_url: str = Field(default="https://api.deepinfra.com/v1/openai", alias="LLM_BASE_URL")
     llm_temperature: float = Field(default=0.0, alias="LLM_TEMPERATURE")
     llm_max_tokens: int = Field(default=5000, alias="LLM_MAX_TOKENS")
+    llm_max_prompt_tokens: int = Field(default=131072, alias="LLM_MAX_PROMPT_TOKENS")  # 0 = no context budget
+    llm_max_concurrency: int = Field(default=8, alias="LLM_MAX_CONCURRENCY")  # in-flight LLM requests per process
+    llm_prompt_cache_control: bool = Field(default=False, alias="LLM_PROMPT_CACHE_CONTROL")
+    llm_image_cache_max_mb: int = Field(default=512, alias="LLM_IMAGE_CACHE_MAX_MB")  # 0 = no on-disk cache
+    llm_enable_response_cache: bool = Field(default=False, alias="LLM_ENABLE_RESPONSE_CACHE")
+    llm_response_cache_ttl: int = Field(default=900, alias="LLM_RESPONSE_CACHE_TTL")  # seconds; 0 = disabled
+    llm_semantic_cache: bool = Field(default=False, alias="LLM_SEMANTIC_CACHE")
+    llm_semantic_cache_threshold: float = Field(default=0.92, alias="LLM_SEMANTIC_CACHE_THRESHOLD")
     
     # Optional: OpenAI for vision tasks
     openai_api_key: str = Field(default="", alias="OPENAI_API_KEY")
@@ -31,6 +39,8 @@ class Settings(BaseSettings):
     upload_dir: Path = Field(default=Path("./uploads"), alias="UPLOAD_DIR")
     images_dir: Path = Field(default=Path("./extracted_images"), alias="IMAGES_DIR")
     max_image_width: int = Field(default=800, alias="MAX_IMAGE_WIDTH")
+    extracted_image_format: str = Field(default="png", alias="EXTRACTED_IMAGE_FORMAT")  # png | webp
+    cache_dir: Path = Field(default=Path("./cache"), alias="CACHE_DIR")
     
     # Chunking Configuration
     chunk_overlap_percentage: float = Field(default=0.20, alias="CHUNK_OVERLAP_PERCENTAGE")
@@ -39,6 +49,13 @@ class Settings(BaseSettings):
     
     # LlamaIndex Configuration
     embedding_model: str = Field(default="BAAI/bge-small-en-v1.5", alias="EMBEDDING_MODEL")
+    embed_batch_size: int = Field(default=32, alias="EMBED_BATCH_SIZE")
+    
+    # Image Embedding (BGE-VL) Configuration
+    image_embed_quantize_cpu: bool = Field(default=True, alias="IMAGE_EMBED_QUANTIZE_CPU")
+    image_embed_gpu_memory_fraction: float = Field(default=0.0, alias="IMAGE_EMBED_GPU_MEMORY_FRACTION")  # 0 = no cap
+    image_embed_batch_size: int = Field(default=0, alias="IMAGE_EMBED_BATCH_SIZE")  # 0 = auto-detect from free GPU memory
+    image_embed_compile: bool = Field(default=True, alias="IMAGE_EMBED_COMPILE")  # torch.compile the vision tower on CUDA
     
     # Qdrant Configuration
     qdrant_url: str = Field(default="http://localhost:6333", alias="QDRANT_URL")
@@ -46,6 +63,10 @@ class Settings(BaseSettings):
     qdrant_port: int = Field(default=6333, alias="QDRANT_PORT")
     qdrant_collection: str = Field(default="petro_rag_vectors", alias="QDRANT_COLLECTION")
     qdrant_api_key: str = Field(default="", alias="QDRANT_API_KEY")
+    qdrant_prefer_grpc: bool = Field(default=True, alias="QDRANT_PREFER_GRPC")
+    qdrant_grpc_port: int = Field(default=6334, alias="QDRANT_GRPC_PORT")
+    qdrant_indexing_threshold: int = Field(default=20000, alias="QDRANT_INDEXING_THRESHOLD")  # restored after bulk loads
+    qdrant_float16_vectors: bool = Field(default=True, alias="QDRANT_FLOAT16_VECTORS")  # new collections only
     
     # MongoDB Collection Names
     documents_collection: str = Field(default="rag_documents", alias="DOCUMENTS_COLLECTION")
@@ -83,6 +104,7 @@ class Settings(BaseSettings):
         self.upload_dir.mkdir(parents=True, exist_ok=True)
         self.images_dir.mkdir(parents=True, exist_ok=True)
         self.chat_images_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
 
 
 @lru_cache()
@@ -151,12 +151,16 @@ class DocumentController:
                 )
 
             images = []
+            image_embeddings = {}
             if "document" in parsed:
                 from app.services.image_extractor import get_image_extractor
+                from app.services.image_pipeline import ImageIngestionPipeline
                 image_extractor = get_image_extractor()
-                # Offload image extraction (likely file I/O and processing)
-                images = await run_in_threadpool(
-                    image_extractor.extract_images_from_docling,
+                # Extraction and embedding overlap in the pipeline; upsert waits
+                # for the vision analysis below since it feeds the payload
+                pipeline = ImageIngestionPipeline(image_extractor, self.image_embedder)
+                images, image_embeddings = await run_in_threadpool(
+                    pipeline.run,
                     parsed["document"], 
                     document_id,
                     True, # save_to_disk
@@ -188,10 +192,10 @@ class DocumentController:
                     batch_id, filename, "indexing", f"Indexing {len(chunks)} chunks..."
                 )
             
-            # Offload indexing (likely sync network calls to Qdrant if using standard client)
-            await run_in_threadpool(
-                self.indexer.index_chunks,
-                chunks
+            # Embedding runs in a worker thread; upserts go out concurrently.
+            # Multi-batch documents defer HNSW building until the load ends
+            await self.indexer.aindex_chunks(
+                chunks, bulk_load=len(chunks) > self.indexer.UPSERT_BATCH_SIZE
             )
             
             # LINKING: Associate images with sections using TOC
@@ -251,29 +255,33 @@ class DocumentController:
 
                 await self.document_repo.store_images(images)
                 
-                # Generate embeddings
+                # Generate embeddings (most were already produced by the pipeline)
                 try:
-                    image_files = []
-                    for img in images:
-                        if img.image_path and Path(img.image_path).exists():
-                            image_files.append(img.image_path)
-                        else:
-                            image_files.append(None)
+                    missing = [
+                        img for img in images
+                        if img.image_id not in image_embeddings
+                        and img.image_path and Path(img.image_path).exists()
+                    ]
                     
-                    if any(image_files):
+                    if missing:
                         # Offload heavy embedding generation
                         embeddings = await run_in_threadpool(
                             self.image_embedder.embed_images_batch,
-                            image_files
+                            [img.image_path for img in missing]
                         )
-                        
+                        for img, emb in zip(missing, embeddings):
+                            if emb is not None:
+                                image_embeddings[img.image_id] = emb
+                    
+                    if image_embeddings:
                         image_dicts = []
-                        for i, img in enumerate(images):
-                            if i < len(embeddings) and embeddings[i] is not None:
+                        for img in images:
+                            embedding = image_embeddings.get(img.image_id)
+                            if embedding is not None:
                                 image_dicts.append({
                                     "image_id": img.image_id,
                                     "page_number": img.page_number,
-                                    "embedding": embeddings[i],
+                                    "embedding": embedding,
                                     "section_title": img.section_title or "",
                                     "caption": img.caption or "",
                                     "image_path": img.image_path,
@@ -383,7 +391,7 @@ class DocumentController:
             raise DocumentNotFoundError(document_id)
         
         # Delete from all vector collections
-        self.indexer.delete_document(document_id)
+        await self.indexer.adelete_document(document_id)
         
         # Delete chunks
         await self.chunk_repo.delete_by_document(document_id)
@@ -528,8 +536,7 @@ class DocumentController:
         
         # Delete from all vector collections
         try:
-            from starlette.concurrency import run_in_threadpool
-            await run_in_threadpool(self.indexer.delete_document, document_id)
+            await self.indexer.adelete_document(document_id)
         except Exception as e:
             logger.warning(f"Failed to delete from vector store: {e}")
         
@@ -87,6 +87,7 @@ class Container:
         # Initialize services
         self.indexer.initialize()
         self.llm.initialize()
+        self.llm.set_embed_model(self.indexer.embed_model)
         self.rerank_service.initialize()
         
         # Initialize Guard
@@ -130,6 +131,9 @@ class Container:
     async def shutdown(self) -> None:
         """Cleanup on shutdown."""
         logger.info("Shutting down dependency container...")
+        await self.indexer.aclose()
+        await self.llm.aclose()
+        self.image_embedder.close()
         await self.base_repo.disconnect()
         logger.info("Dependency container shutdown complete")
 
@@ -2,7 +2,7 @@
 Document schemas.
 """
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Optional, List
 from datetime import datetime
 
 from .common import DocumentStatus
@@ -56,6 +56,10 @@ class ExtractedImage(BaseModel):
     section_title: Optional[str] = None
     chunk_ids: List[str] = Field(default_factory=list)
     analysis: Optional[str] = None
+    # Low-detail JPEG written next to image_path at ingestion, sent to the LLM
+    thumbnail_path: Optional[str] = None
+    # In-memory PIL image handed from extraction to embedding; never serialized
+    pil_image: Optional[Any] = Field(default=None, exclude=True, repr=False)
 
 
 class ExtractedTable(BaseModel):
@@ -2,12 +2,16 @@
 Image embedding service using BAAI/bge-vl-base multimodal embedder.
 Generates embeddings for images and text in the same embedding space.
 """
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 import logging
 import base64
 import io
+import re
 from pathlib import Path
-import os
+from hashlib import blake2b
+from contextlib import contextmanager
+from functools import lru_cache
+import threading
 
 from PIL import Image
 import numpy as np
@@ -19,10 +23,200 @@ except ImportError:
     TORCH_AVAILABLE = False
     torch = None
 
+try:
+    # SIMD base64 decoder; drop-in replacement for the stdlib module
+    import pybase64 as b64
+except ImportError:
+    b64 = base64
+
+try:
+    import h5py
+    H5PY_AVAILABLE = True
+except ImportError:
+    H5PY_AVAILABLE = False
+    h5py = None
+
 from app.config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Formats we actually receive; tried first so Pillow skips probing every plugin
+_DECODE_FORMATS = ("PNG", "JPEG", "WEBP")
+
+# Vision tower input side; JPEGs are DCT-downscaled toward this on decode
+_MODEL_INPUT_SIZE = (224, 224)
+
+
+def _looks_like_path(value: str) -> bool:
+    """Whether value names an existing file (base64 payloads are never paths)."""
+    # Fix: Check length to avoid [Errno 36] File name too long
+    return len(value) < 1024 and _path_exists(value)
+
+
+@lru_cache(maxsize=4096)
+def _path_exists(path: str) -> bool:
+    """
+    Memoized stat() probe for image paths.
+    Call invalidate_path_cache() after new images land on disk.
+    """
+    try:
+        return Path(path).exists()
+    except OSError:
+        return False
+
+
+def invalidate_path_cache() -> None:
+    """Forget memoized path probes (call after ingesting images)."""
+    _path_exists.cache_clear()
+
+
+def _decode_rgb(data: bytes) -> Image.Image:
+    """
+    Decode image bytes to RGB in a single pass.
+    JPEGs use Pillow's draft mode to decode at the smallest DCT scale that
+    still covers the model input, so full-resolution pixels are never built.
+    """
+    try:
+        pil_img = Image.open(io.BytesIO(data), formats=_DECODE_FORMATS)
+    except Exception:
+        pil_img = Image.open(io.BytesIO(data))
+    if pil_img.format == "JPEG":
+        pil_img.draft("RGB", _MODEL_INPUT_SIZE)
+    return pil_img.convert("RGB")
+
+
+def _to_unit_vectors(embedding) -> np.ndarray:
+    """
+    Convert model output (tensor or array) to L2-normalized float32 rows.
+    Normalizing once here lets cosine similarity reduce to a dot product.
+    """
+    if TORCH_AVAILABLE and isinstance(embedding, torch.Tensor):
+        embedding = embedding.detach().float().cpu().numpy()
+    arr = np.ascontiguousarray(embedding, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return arr / norms
+
+
+class EmbeddingCache:
+    """
+    Persistent on-disk embedding cache backed by a single HDF5 file.
+
+    Vectors live in a resizable float32 dataset and their keys in a parallel
+    string dataset; the key -> row map is rebuilt in memory on open.
+    The file name carries the model and precision (see BGEVLEmbedder), so a
+    checkpoint or dtype change starts a fresh cache instead of mixing vectors.
+
+    Single-process: HDF5 locks the file for writing, so with several workers
+    only the first one to open it gets a cache; the others run uncached.
+    Appends are flushed every FLUSH_EVERY rows and on close().
+    """
+
+    FLUSH_EVERY = 256
+
+    def __init__(self, path: Path, dim: int):
+        self.path = Path(path)
+        self.dim = dim
+        self._file = None
+        self._index: dict = {}
+        self._lock = threading.Lock()
+        self._disabled = not H5PY_AVAILABLE
+        self._unflushed = 0
+
+    def _open(self) -> bool:
+        """Open (or create) the HDF5 file lazily. Returns False if unusable."""
+        if self._file is not None:
+            return True
+        if self._disabled:
+            return False
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = h5py.File(self.path, "a")
+
+            if "vectors" not in self._file:
+                self._file.create_dataset(
+                    "vectors", shape=(0, self.dim), maxshape=(None, self.dim),
+                    dtype="float32", chunks=(256, self.dim), compression="lzf"
+                )
+                self._file.create_dataset(
+                    "keys", shape=(0,), maxshape=(None,),
+                    dtype=h5py.string_dtype(), chunks=(1024,), compression="lzf"
+                )
+            elif self._file["vectors"].shape[1] != self.dim:
+                logger.warning(
+                    f"Embedding cache dimension mismatch "
+                    f"({self._file['vectors'].shape[1]} != {self.dim}), disabling cache"
+                )
+                self._file.close()
+                self._file = None
+                self._disabled = True
+                return False
+
+            keys = self._file["keys"].asstr()[:]
+            self._index = {k: i for i, k in enumerate(keys)}
+            logger.info(f"Opened embedding cache {self.path} ({len(self._index)} entries)")
+            return True
+
+        except Exception as e:
+            logger.warning(
+                f"Could not open embedding cache {self.path} (held by another worker process?), "
+                f"running uncached: {e}"
+            )
+            self._file = None
+            self._disabled = True
+            return False
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the cached vector for key, or None on miss."""
+        with self._lock:
+            if not self._open():
+                return None
+            row = self._index.get(key)
+            if row is None:
+                return None
+            return self._file["vectors"][row]
+
+    def put(self, key: str, vector) -> None:
+        """Append a vector under key."""
+        self.put_many([key], [vector])
+
+    def put_many(self, keys: List[str], vectors) -> None:
+        """Append several vectors with one resize per dataset."""
+        with self._lock:
+            if not self._open():
+                return
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._index and key not in new:
+                    new[key] = np.asarray(vector, dtype=np.float32).reshape(-1)
+            if not new:
+                return
+            try:
+                vec_ds = self._file["vectors"]
+                key_ds = self._file["keys"]
+                start = vec_ds.shape[0]
+                end = start + len(new)
+                vec_ds.resize(end, axis=0)
+                key_ds.resize(end, axis=0)
+                vec_ds[start:end] = np.stack(list(new.values()))
+                key_ds[start:end] = list(new)
+                for row, key in enumerate(new, start):
+                    self._index[key] = row
+                self._unflushed += len(new)
+                if self._unflushed >= self.FLUSH_EVERY:
+                    self._file.flush()
+                    self._unflushed = 0
+            except Exception as e:
+                logger.warning(f"Could not write embedding cache entries: {e}")
+
+    def close(self) -> None:
+        """Flush and close the underlying HDF5 file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
 
 class BGEVLEmbedder:
     """
@@ -37,12 +231,26 @@ class BGEVLEmbedder:
     
     MODEL_NAME = "BAAI/BGE-VL-base"
     
+    # Auto batch sizing: candidate sizes and a conservative per-image budget
+    # (224x224x3 FP16 input plus ~50 MB of base-ViT activations)
+    BATCH_SIZE_CANDIDATES = (64, 32, 16, 8)
+    BYTES_PER_IMAGE = 3 * 224 * 224 * 2 + 50 * 1024 * 1024
+    CPU_BATCH_SIZE = 8
+    
     def __init__(self):
         self.settings = get_settings()
         self.model = None
         self._initialized = False
         self._embedding_dim = 512  # BGE-VL-base dimension
         self._use_fallback = False
+        self._cache: Optional[EmbeddingCache] = None
+        self.device = "cpu"
+        self._amp_dtype = None  # Reduced-precision dtype when running on CUDA
+        self._copy_stream = None  # Side CUDA stream for host-to-device copies
+        self._batch_size: Optional[int] = None
+        self._compiled = False  # Vision tower wrapped by torch.compile
+        self._eager_vision_model = None  # Uncompiled tower, used after an OOM backoff
+        self._precision = "fp32"  # fp32 | bf16 | fp16 | int8; part of the cache name
     
     def initialize(self) -> None:
         """Initialize the BGE-VL model."""
@@ -67,13 +275,22 @@ class BGEVLEmbedder:
             )
             self.model.set_processor(self.MODEL_NAME)
             self.model.eval()
+            self._select_precision()
+            self._compile_vision_tower()
             
             # Get embedding dimension from a test
-            with torch.no_grad():
+            with self._inference():
                 test_emb = self.model.encode(text="test")
                 self._embedding_dim = test_emb.shape[-1]
             
+            self._warmup()
+            
             logger.info(f"BGE-VL initialized. Embedding dimension: {self._embedding_dim}")
+            model_slug = re.sub(r"[^A-Za-z0-9]+", "-", self.MODEL_NAME).strip("-").lower()
+            self._cache = EmbeddingCache(
+                self.settings.cache_dir / f"bgevl_embeddings_{model_slug}_{self._precision}.h5",
+                self._embedding_dim
+            )
             self._initialized = True
             
         except ImportError as e:
@@ -86,6 +303,112 @@ class BGEVLEmbedder:
             self._use_fallback = True
             self._initialized = True
     
+    def close(self) -> None:
+        """Flush and close the embedding cache (called on shutdown)."""
+        if self._cache is not None:
+            self._cache.close()
+    
+    def _select_precision(self) -> None:
+        """
+        Move the model to CUDA in reduced precision when available.
+        BF16 on Ampere+ (wider range), FP16 on Volta/Turing tensor cores,
+        FP32 everywhere else, optionally INT8-quantized on CPU.
+        """
+        if not torch.cuda.is_available():
+            if self.settings.image_embed_quantize_cpu:
+                self._quantize_for_cpu()
+            return
+        
+        major, _ = torch.cuda.get_device_capability()
+        self.device = "cuda"
+        
+        # Fixed 224x224 ViT input: let cuDNN autotune once; TF32 matmul on Ampere+
+        torch.backends.cudnn.benchmark = True
+        torch.set_float32_matmul_precision("high")
+        
+        fraction = self.settings.image_embed_gpu_memory_fraction
+        if 0 < fraction <= 1:
+            torch.cuda.set_per_process_memory_fraction(fraction)
+        
+        if major >= 8:
+            self._amp_dtype = torch.bfloat16
+            self._precision = "bf16"
+            self.model = self.model.to(self.device, dtype=torch.bfloat16)
+        elif major >= 7:
+            self._amp_dtype = torch.float16
+            self._precision = "fp16"
+            self.model = self.model.to(self.device).half()
+        else:
+            self.model = self.model.to(self.device)
+        
+        logger.info(f"BGE-VL running on {self.device} ({self._amp_dtype or torch.float32})")
+    
+    def _quantize_for_cpu(self) -> None:
+        """
+        Dynamically quantize the transformer Linear layers to INT8.
+        Weights are stored as int8 and activations quantized on the fly,
+        which maps the matmul-bound towers onto oneDNN/VNNI INT8 GEMM.
+        """
+        try:
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            self._precision = "int8"
+            logger.info("BGE-VL quantized to INT8 for CPU inference")
+        except Exception as e:
+            logger.warning(f"INT8 quantization failed, keeping FP32: {e}")
+    
+    def _compile_vision_tower(self) -> None:
+        """
+        Compile the ViT image tower with torch.compile on CUDA.
+        Inputs are always 224x224 and batches are padded to a fixed size,
+        so the graph is captured once; falls back to eager on any failure.
+        """
+        if self.device != "cuda" or not self.settings.image_embed_compile:
+            return
+        if not hasattr(torch, "compile") or not hasattr(self.model, "vision_model"):
+            return
+        
+        try:
+            self._eager_vision_model = self.model.vision_model
+            self.model.vision_model = torch.compile(
+                self.model.vision_model,
+                mode="reduce-overhead",
+                fullgraph=False,
+                dynamic=False
+            )
+            self._compiled = True
+            logger.info("BGE-VL vision tower compiled with torch.compile")
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable, running eager: {e}")
+    
+    def _warmup(self) -> None:
+        """
+        Run one text and one image forward so CUDA kernel selection and
+        cuDNN autotuning happen at startup, not on the first real request.
+        """
+        try:
+            with self._inference():
+                self.model.encode(text="warmup")
+            self._encode_pil_batch([Image.new("RGB", (224, 224))])
+            
+            if self.device == "cuda":
+                torch.cuda.synchronize()
+                torch.cuda.empty_cache()
+            logger.info("BGE-VL warm-up complete")
+        except Exception as e:
+            logger.warning(f"BGE-VL warm-up failed: {e}")
+    
+    @contextmanager
+    def _inference(self):
+        """Inference-mode context with autocast when running reduced precision."""
+        with torch.inference_mode():
+            if self._amp_dtype is not None:
+                with torch.autocast(device_type=self.device, dtype=self._amp_dtype):
+                    yield
+            else:
+                yield
+    
     @property
     def embedding_dim(self) -> int:
         """Get the embedding dimension."""
@@ -100,7 +423,7 @@ class BGEVLEmbedder:
         self, 
         image: Union[Image.Image, str, bytes],
         text: Optional[str] = None
-    ) -> Optional[List[float]]:
+    ) -> Optional[np.ndarray]:
         """
         Generate embedding for an image, optionally combined with text.
         
@@ -109,7 +432,7 @@ class BGEVLEmbedder:
             text: Optional text to combine with image (for composed queries)
             
         Returns:
-            Embedding vector as list of floats
+            Unit-length float32 embedding vector
         """
         if not self._initialized:
             self.initialize()
@@ -118,16 +441,23 @@ class BGEVLEmbedder:
             # Fallback: use text description if available
             if text:
                 fallback = self._get_fallback_embedder()
-                return fallback.get_text_embedding(text)
+                return np.asarray(fallback.get_text_embedding(text), dtype=np.float32)
             return None
         
         try:
             # Convert to file path for model
-            image_path = self._prepare_image(image)
+            image_path, key = self._prepare_image(image)
             if image_path is None:
                 return None
             
-            with torch.no_grad():
+            if text:
+                key = f"{key}:t:{self._text_key(text)}"
+            
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+            
+            with self._inference():
                 if text:
                     # Combined image + text query
                     embedding = self.model.encode(images=image_path, text=text)
@@ -135,13 +465,15 @@ class BGEVLEmbedder:
                     # Image only
                     embedding = self.model.encode(images=image_path)
                 
-                return embedding.squeeze().tolist()
+                vector = _to_unit_vectors(embedding.squeeze())
+                self._cache.put(key, vector)
+                return vector
                 
         except Exception as e:
             logger.error(f"Error generating image embedding: {e}")
             return None
     
-    def embed_text(self, text: str) -> Optional[List[float]]:
+    def embed_text(self, text: str) -> Optional[np.ndarray]:
         """
         Generate text embedding in the same space as images.
         
@@ -149,19 +481,26 @@ class BGEVLEmbedder:
             text: Text query
             
         Returns:
-            Embedding vector
+            Unit-length float32 embedding vector
         """
         if not self._initialized:
             self.initialize()
         
         if self._use_fallback:
             fallback = self._get_fallback_embedder()
-            return fallback.get_text_embedding(text)
+            return np.asarray(fallback.get_text_embedding(text), dtype=np.float32)
+        
+        key = f"t:{self._text_key(text)}"
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
         
         try:
-            with torch.no_grad():
+            with self._inference():
                 embedding = self.model.encode(text=text)
-                return embedding.squeeze().tolist()
+                vector = _to_unit_vectors(embedding.squeeze())
+                self._cache.put(key, vector)
+                return vector
         except Exception as e:
             logger.error(f"Error generating text embedding: {e}")
             return None
@@ -169,7 +508,7 @@ class BGEVLEmbedder:
     def embed_images_batch(
         self, 
         images: List[Union[Image.Image, str, bytes]]
-    ) -> List[Optional[List[float]]]:
+    ) -> List[Optional[np.ndarray]]:
         """
         Generate embeddings for multiple images in batch.
         
@@ -177,7 +516,7 @@ class BGEVLEmbedder:
             images: List of images
             
         Returns:
-            List of embedding vectors
+            List of unit-length float32 embedding vectors (None on failure)
         """
         if not self._initialized:
             self.initialize()
@@ -188,107 +527,221 @@ class BGEVLEmbedder:
         results = []
         
         # Process in batches
-        batch_size = 8
+        batch_size = self._get_batch_size()
         for i in range(0, len(images), batch_size):
             batch = images[i:i + batch_size]
+            batch_results: List[Optional[np.ndarray]] = [None] * len(batch)
             
-            image_paths = []
-            for img in batch:
-                path = self._prepare_image(img)
-                if path:
-                    image_paths.append(path)
+            # Resolve cache hits; only misses are decoded and encoded
+            miss_idx = []
+            miss_pils = []
+            miss_keys = []
+            for j, img in enumerate(batch):
+                pil_img, key = self._load_image(img)
+                if pil_img is None:
+                    continue
+                cached = self._cache.get(key)
+                if cached is not None:
+                    batch_results[j] = cached
                 else:
-                    image_paths.append(None)
+                    miss_idx.append(j)
+                    miss_pils.append(pil_img)
+                    miss_keys.append(key)
             
-            # Filter valid paths
-            valid_paths = [p for p in image_paths if p is not None]
-            
-            if not valid_paths:
-                results.extend([None] * len(batch))
-                continue
-            
-            try:
-                with torch.no_grad():
-                    embeddings = self.model.encode(images=valid_paths)
+            if miss_pils:
+                try:
+                    unit = self._encode_with_backoff(miss_pils)
                     
                     # Map back to original order
-                    valid_idx = 0
-                    for path in image_paths:
-                        if path is not None:
-                            results.append(embeddings[valid_idx].tolist())
-                            valid_idx += 1
-                        else:
-                            results.append(None)
-                            
-            except Exception as e:
-                logger.error(f"Error in batch embedding: {e}")
-                results.extend([None] * len(batch))
+                    self._cache.put_many(miss_keys, unit)
+                    for j, emb in zip(miss_idx, unit):
+                        batch_results[j] = emb
+                                
+                except Exception as e:
+                    logger.error(f"Error in batch embedding: {e}")
+            
+            results.extend(batch_results)
         
         return results
     
-    def _prepare_image(
-        self, 
+    def _get_batch_size(self) -> int:
+        """Configured batch size, or one sized to free GPU memory."""
+        if self._batch_size is None:
+            self._batch_size = (
+                self.settings.image_embed_batch_size or self._autodetect_batch_size()
+            )
+            logger.info(f"BGE-VL image batch size: {self._batch_size}")
+        return self._batch_size
+    
+    def _autodetect_batch_size(self) -> int:
+        """Largest candidate batch whose estimated footprint fits in free GPU memory."""
+        if self.device != "cuda":
+            return self.CPU_BATCH_SIZE
+        
+        try:
+            free_bytes, _ = torch.cuda.mem_get_info()
+        except Exception as e:
+            logger.warning(f"Could not query GPU memory: {e}")
+            return self.CPU_BATCH_SIZE
+        
+        for candidate in self.BATCH_SIZE_CANDIDATES:
+            if candidate * self.BYTES_PER_IMAGE <= free_bytes:
+                return candidate
+        return self.BATCH_SIZE_CANDIDATES[-1]
+    
+    def _encode_with_backoff(self, pil_images: List[Image.Image]) -> np.ndarray:
+        """
+        Encode a batch, halving it on CUDA OOM until it fits.
+        A successful smaller size is kept for subsequent batches.
+        The compiled tower is captured for one fixed batch shape, so an OOM
+        also switches back to the eager tower rather than recompiling and
+        re-capturing CUDA graphs for every new size.
+        """
+        try:
+            return _to_unit_vectors(self._encode_pil_batch(pil_images))
+        except torch.cuda.OutOfMemoryError:
+            if len(pil_images) == 1 and not self._compiled:
+                raise
+            torch.cuda.empty_cache()
+            if self._compiled:
+                self._disable_compiled_tower()
+                if len(pil_images) == 1:
+                    return self._encode_with_backoff(pil_images)
+            half = len(pil_images) // 2
+            self._batch_size = max(1, min(self._get_batch_size(), half))
+            logger.warning(f"CUDA OOM in image embedding, retrying with batch size {half}")
+            return np.concatenate([
+                self._encode_with_backoff(pil_images[:half]),
+                self._encode_with_backoff(pil_images[half:]),
+            ])
+    
+    def _disable_compiled_tower(self) -> None:
+        """Swap the eager vision tower back in and stop padding batches."""
+        self.model.vision_model = self._eager_vision_model
+        self._compiled = False
+        logger.warning("CUDA OOM with the compiled vision tower, running eager from now on")
+    
+    def _encode_pil_batch(self, pil_images: List[Image.Image]):
+        """
+        Run one forward pass of the vision tower over decoded images.
+        Preprocessing happens once for the whole batch; on CUDA the pixel
+        tensor is pinned and copied on a side stream so the transfer can
+        overlap with work already queued on the compute stream.
+        """
+        inputs = self.model.processor(images=pil_images, return_tensors="pt")
+        pixel_values = inputs["pixel_values"]
+        
+        # Pad short batches so the compiled graph always sees one shape
+        count = pixel_values.shape[0]
+        if self._compiled and count < self._get_batch_size():
+            pad = pixel_values.new_zeros((self._get_batch_size() - count, *pixel_values.shape[1:]))
+            pixel_values = torch.cat([pixel_values, pad])
+        
+        if self.device == "cuda":
+            dtype = self._amp_dtype or torch.float32
+            compute_stream = torch.cuda.current_stream()
+            if self._copy_stream is None:
+                self._copy_stream = torch.cuda.Stream()
+            with torch.cuda.stream(self._copy_stream):
+                pixel_values = pixel_values.pin_memory().to(
+                    self.device, dtype=dtype, non_blocking=True
+                )
+            compute_stream.wait_stream(self._copy_stream)
+            pixel_values.record_stream(compute_stream)
+        
+        with self._inference():
+            features = self.model.get_image_features(pixel_values=pixel_values)
+        # CUDA-graph outputs are reused by the next replay; take our own copy
+        return features[:count].clone() if self._compiled else features
+    
+    @staticmethod
+    def _content_key(data: bytes) -> str:
+        """Stable cache key for raw image bytes."""
+        return blake2b(data, digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _text_key(text: str) -> str:
+        """Stable cache key for a text query."""
+        return blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _load_image(
+        self,
         image: Union[Image.Image, str, bytes]
-    ) -> Optional[str]:
+    ) -> Tuple[Optional[Image.Image], Optional[str]]:
         """
-        Prepare image for the model (convert to file path).
-        BGE-VL accepts file paths directly.
+        Decode an image to RGB in memory, without touching temp files.
+        
+        Returns:
+            (RGB PIL image, content-hash cache key), or (None, None) on failure
         """
         try:
+            if isinstance(image, Image.Image):
+                pil_img = image.convert("RGB")
+                return pil_img, self._content_key(pil_img.tobytes() + repr(pil_img.size).encode())
+            
             if isinstance(image, str):
-                # Fix: Check length to avoid [Errno 36] File name too long
-                is_valid_path = False
-                if len(image) < 1024:  # Reasonable max path length
-                    try:
-                        if Path(image).exists():
-                            is_valid_path = True
-                    except OSError:
-                        pass
-                
-                if is_valid_path:
-                    return image
+                # Read a file once: the same bytes feed both hash and decoder
+                if _looks_like_path(image):
+                    data = Path(image).read_bytes()
                 else:
-                    # Try as base64
-                    try:
-                        img_bytes = base64.b64decode(image)
-                        pil_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-                    except Exception:
-                        return None
+                    data = b64.b64decode(image)
             elif isinstance(image, bytes):
-                pil_img = Image.open(io.BytesIO(image)).convert("RGB")
-            elif isinstance(image, Image.Image):
-                pil_img = image.convert("RGB")
+                data = image
             else:
                 logger.warning(f"Unknown image type: {type(image)}")
-                return None
+                return None, None
+            
+            return _decode_rgb(data), self._content_key(data)
+        
+        except Exception as e:
+            logger.error(f"Error loading image: {e}")
+            return None, None
+    
+    def _prepare_image(
+        self, 
+        image: Union[Image.Image, str, bytes]
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Prepare image for the model (convert to file path).
+        BGE-VL accepts file paths directly.
+        
+        Returns:
+            (file path, content-hash cache key), or (None, None) on failure
+        """
+        try:
+            if isinstance(image, str) and _looks_like_path(image):
+                return image, self._content_key(Path(image).read_bytes())
+            
+            pil_img, key = self._load_image(image)
+            if pil_img is None:
+                return None, None
             
             # Save to temp file
             import tempfile
             with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
                 pil_img.save(f.name)
-                return f.name
+                return f.name, key
                 
         except Exception as e:
             logger.error(f"Error preparing image: {e}")
-            return None
+            return None, None
     
     def compute_similarity(
         self, 
-        embedding1: List[float], 
-        embedding2: List[float]
+        embedding1: Union[np.ndarray, List[float]], 
+        embedding2: Union[np.ndarray, List[float]]
     ) -> float:
-        """Compute cosine similarity between two embeddings."""
-        arr1 = np.array(embedding1)
-        arr2 = np.array(embedding2)
+        """Compute cosine similarity between two embeddings (any norm)."""
+        arr1 = np.asarray(embedding1, dtype=np.float32)
+        arr2 = np.asarray(embedding2, dtype=np.float32)
         
-        dot_product = np.dot(arr1, arr2)
         norm1 = np.linalg.norm(arr1)
         norm2 = np.linalg.norm(arr2)
         
         if norm1 == 0 or norm2 == 0:
             return 0.0
         
-        return float(dot_product / (norm1 * norm2))
+        return float(np.dot(arr1, arr2) / (norm1 * norm2))
 
 
 # Global image embedder instance
@@ -3,27 +3,146 @@ Image extraction service using IBM Docling.
 Extracts figures/images from PDFs using Docling's picture detection.
 """
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Iterator, List, Optional, Dict, Union
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
+import threading
 import base64
 import io
+import re
+import numpy as np
 from PIL import Image
 
 from app.config.settings import get_settings
 from app.schemas import ExtractedImage, TOCEntry
+from app.services.image_embedder import invalidate_path_cache
+from app.utils.image_utils import make_thumbnail_jpeg
 
 logger = logging.getLogger(__name__)
 
+# Docling picture labels: PICTURE, FIGURE, IMAGE (enum or value form)
+_PICTURE_LABEL_RX = re.compile(r'PICTURE|FIGURE|IMAGE', re.IGNORECASE)
+
+# Stand-in for an open-ended TOC entry (page_end is None or 0)
+_NO_PAGE_END = np.iinfo(np.int64).max
+
+
+class ImageIndex:
+    """
+    Column view of extracted images for page-range queries.
+    Page numbers live in one contiguous int32 array so lookups are
+    vectorized comparisons instead of attribute walks over the list.
+    Build it once per image list and reuse it across queries.
+    """
+    
+    __slots__ = ("images", "pages", "sections")
+    
+    def __init__(self, images: List[ExtractedImage]):
+        self.images = images
+        self.pages = np.fromiter(
+            (img.page_number for img in images), dtype=np.int32, count=len(images)
+        )
+        self.sections: List[Optional[str]] = [img.section_title for img in images]
+    
+    def __len__(self) -> int:
+        return len(self.images)
+    
+    def in_page_range(self, page_start: int, page_end: int) -> List[ExtractedImage]:
+        """Images with page_start <= page <= page_end, in list order."""
+        mask = (self.pages >= page_start) & (self.pages <= page_end)
+        return [self.images[i] for i in np.flatnonzero(mask)]
+    
+    def assign_sections(self, toc: List[TOCEntry]) -> None:
+        """
+        Set section_title from the first TOC entry whose range covers each page.
+        TOC order decides ties between nested sections; a sorted searchsorted
+        would pick the last overlapping entry instead.
+        """
+        # Index of the first matching TOC entry per image (-1 = none)
+        section_idx = np.full(len(self.images), -1, dtype=np.int64)
+        
+        for t, entry in enumerate(toc):
+            page_end = entry.page_end or _NO_PAGE_END
+            match = (section_idx < 0) & (self.pages >= entry.page_number) & (self.pages <= page_end)
+            section_idx[match] = t
+        
+        for i in np.flatnonzero(section_idx >= 0):
+            title = toc[section_idx[i]].title
+            self.images[i].section_title = title
+            self.sections[i] = title
+
 
 class DoclingImageExtractor:
     """
     Extracts images/figures from PDF documents using Docling.
     """
     
+    SUPPORTED_FORMATS = ("png", "webp")
+    
     def __init__(self):
         self.settings = get_settings()
         self.min_width = 100
         self.min_height = 100
+        self.image_format = self.settings.extracted_image_format.lower()
+        if self.image_format not in self.SUPPORTED_FORMATS:
+            logger.warning(
+                f"Unsupported EXTRACTED_IMAGE_FORMAT '{self.image_format}', using png"
+            )
+            self.image_format = "png"
+        # Disk writes release the GIL; overlap them with Docling iteration
+        self._io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="img-write")
+        self._converter = None
+        self._converter_lock = threading.Lock()
+    
+    def _write_image(
+        self, path: Path, data: bytes, pil_img: Optional[Image.Image] = None
+    ) -> Optional[str]:
+        """
+        Write image bytes to disk, creating the folder if needed, plus the
+        LLM thumbnail next to it; returns the thumbnail path. Figures that
+        arrived as encoded bytes are decoded here for the thumbnail.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        
+        thumb_path = path.with_name(f"{path.stem}.thumb.jpg")
+        try:
+            if pil_img is None:
+                with Image.open(io.BytesIO(data)) as decoded:
+                    thumb = make_thumbnail_jpeg(decoded, self.settings.max_image_width)
+            else:
+                thumb = make_thumbnail_jpeg(pil_img, self.settings.max_image_width)
+            thumb_path.write_bytes(thumb)
+        except Exception as e:
+            logger.warning(f"Could not save thumbnail {thumb_path.name}: {e}")
+            return None
+        return str(thumb_path)
+    
+    @staticmethod
+    def _finish_write(future: Optional[Future], image: ExtractedImage) -> ExtractedImage:
+        """Wait for an image's pending disk write and report failures."""
+        if future is not None:
+            try:
+                image.thumbnail_path = future.result()
+            except Exception as e:
+                logger.warning(f"Could not save image: {e}")
+        return image
+    
+    def _encode_image(self, pil_img: Image.Image) -> bytes:
+        """
+        Encode a figure for disk storage.
+        PNG uses zlib level 1: the file is re-decoded by the embedder anyway,
+        so the extra size is cheaper than level-6 deflate CPU.
+        """
+        buf = io.BytesIO()
+        if self.image_format == "webp":
+            if pil_img.mode not in ("RGB", "RGBA"):
+                pil_img = pil_img.convert("RGB")
+            pil_img.save(buf, format='WEBP', quality=85, method=0)
+        else:
+            pil_img.save(buf, format='PNG', optimize=False, compress_level=1)
+        return buf.getvalue()
     
     def extract_images_from_docling(
         self, 
@@ -35,118 +154,153 @@ class DoclingImageExtractor:
         """
         Extract images from a Docling document object.
         """
-        images = []
+        images = list(self.iter_images_from_docling(
+            docling_doc, document_id, save_to_disk, category_id
+        ))
+        logger.info(f"Extracted {len(images)} images using Docling")
+        return images
+    
+    def iter_images_from_docling(
+        self, 
+        docling_doc,
+        document_id: str,
+        save_to_disk: bool = True,
+        category_id: str = ""
+    ) -> Iterator[ExtractedImage]:
+        """
+        Yield images from a Docling document object one at a time,
+        so downstream stages can start before extraction finishes.
+        """
+        # (write future, image) in document order; an image is only yielded
+        # once its file is on disk so consumers can read it immediately
+        pending = deque()
+        
+        # Re-ingesting a document recreates paths that may be memoized as
+        # missing; images are only yielded once written, so one clear suffices
+        invalidate_path_cache()
         
         try:
             # Get all picture items from the document
             img_idx = 0
             
+            # O(1) picture lookup by self_ref instead of scanning per item
+            pic_by_ref = {
+                pic.self_ref: pic
+                for pic in getattr(docling_doc, 'pictures', None) or []
+                if getattr(pic, 'self_ref', None) is not None
+            }
+            
+            # Hoisted out of the loop: output directory for this document
+            # extracted_images/{category_id}/{document_id}/
+            if category_id:
+                doc_images_dir = self.settings.images_dir / category_id / document_id
+            else:
+                doc_images_dir = self.settings.images_dir / document_id
+            
+            min_width = self.min_width
+            min_height = self.min_height
+            # Probe failures are routine; only format them when DEBUG is on
+            debug = logger.isEnabledFor(logging.DEBUG)
+            
             for item, level in docling_doc.iterate_items():
                 # Check label - Docling uses different label names
-                label = None
-                if hasattr(item, 'label'):
-                    label = str(item.label)
+                label = getattr(item, 'label', None)
                 
                 # Look for picture/figure labels
                 if label is None:
                     continue
                 
                 # Docling labels can be: PICTURE, FIGURE, or in value form
-                is_picture = any(x in label.upper() for x in ['PICTURE', 'FIGURE', 'IMAGE'])
-                
-                if not is_picture:
+                if not _PICTURE_LABEL_RX.search(str(label)):
                     continue
                 
                 # Get page number
                 page = 1
-                if hasattr(item, 'prov') and item.prov:
-                    for prov in item.prov:
-                        if hasattr(prov, 'page_no'):
-                            page = prov.page_no
-                            break
+                for prov in getattr(item, 'prov', None) or ():
+                    page_no = getattr(prov, 'page_no', None)
+                    if page_no is not None:
+                        page = page_no
+                        break
                 
-                # Try to get image data
+                # Resolve the PIL image first; encode exactly once below
+                pil_img = None
                 image_data = None
-                image_ext = "png"
+                image_ext = self.image_format
                 width = 0
                 height = 0
                 
                 # Method 1: Get from item.image
-                if hasattr(item, 'image') and item.image is not None:
+                item_image = getattr(item, 'image', None)
+                if item_image is not None:
                     try:
-                        if hasattr(item.image, 'pil_image') and item.image.pil_image:
-                            pil_img = item.image.pil_image
-                            width, height = pil_img.size
-                            buf = io.BytesIO()
-                            pil_img.save(buf, format='PNG')
-                            image_data = buf.getvalue()
-                        elif hasattr(item.image, 'tobytes'):
-                            image_data = item.image.tobytes()
+                        pil_img = getattr(item_image, 'pil_image', None)
+                        if not pil_img and hasattr(item_image, 'tobytes'):
+                            image_data = item_image.tobytes()
+                            image_ext = "png"
                     except Exception as e:
-                        logger.debug(f"Could not extract from item.image: {e}")
+                        if debug:
+                            logger.debug("Could not extract from %s: %s", "item.image", e)
                 
                 # Method 2: Get from item.get_image()
-                if not image_data and hasattr(item, 'get_image'):
+                if not pil_img and not image_data and hasattr(item, 'get_image'):
                     try:
                         pil_img = item.get_image(docling_doc)
-                        if pil_img:
-                            width, height = pil_img.size
-                            buf = io.BytesIO()
-                            pil_img.save(buf, format='PNG')
-                            image_data = buf.getvalue()
                     except Exception as e:
-                        logger.debug(f"Could not extract from get_image: {e}")
+                        if debug:
+                            logger.debug("Could not extract from %s: %s", "get_image", e)
                 
                 # Method 3: Get from document's picture export
-                if not image_data and hasattr(docling_doc, 'pictures'):
+                if not pil_img and not image_data and pic_by_ref:
                     try:
-                        for pic in docling_doc.pictures:
-                            if hasattr(pic, 'self_ref') and hasattr(item, 'self_ref'):
-                                if pic.self_ref == item.self_ref:
-                                    if hasattr(pic, 'image') and pic.image:
-                                        if hasattr(pic.image, 'pil_image'):
-                                            pil_img = pic.image.pil_image
-                                            width, height = pil_img.size
-                                            buf = io.BytesIO()
-                                            pil_img.save(buf, format='PNG')
-                                            image_data = buf.getvalue()
-                                            break
+                        pic = pic_by_ref.get(getattr(item, 'self_ref', None))
+                        pic_image = getattr(pic, 'image', None) if pic is not None else None
+                        pil_img = getattr(pic_image, 'pil_image', None) if pic_image else None
                     except Exception as e:
-                        logger.debug(f"Could not extract from pictures: {e}")
+                        if debug:
+                            logger.debug("Could not extract from %s: %s", "pictures", e)
                 
-                if not image_data:
-                    logger.debug(f"No image data found for picture on page {page}")
+                if pil_img:
+                    width, height = pil_img.size
+                    # Skip encoding figures that will be filtered out anyway
+                    if width < min_width or height < min_height:
+                        continue
+                    # Encoding is only needed for the on-disk copy
+                    if save_to_disk:
+                        try:
+                            image_data = self._encode_image(pil_img)
+                        except Exception as e:
+                            if debug:
+                                logger.debug("Could not encode image: %s", e)
+                
+                if not image_data and not pil_img:
+                    if debug:
+                        logger.debug("No image data found for picture on page %s", page)
                     continue
                 
                 # Size validation
-                if width < self.min_width or height < self.min_height:
+                if width < min_width or height < min_height:
                     continue
                 
                 # Generate ID and path - save in category/document folder
                 image_id = f"{document_id}_p{page}_img{img_idx}"
                 image_filename = f"p{page}_img{img_idx}.{image_ext}"
-                # Create folder: extracted_images/{category_id}/{document_id}/
-                if category_id:
-                    doc_images_dir = self.settings.images_dir / category_id / document_id
-                else:
-                    doc_images_dir = self.settings.images_dir / document_id
                 image_path = doc_images_dir / image_filename
                 
-                # Save to disk
-                if save_to_disk:
-                    try:
-                        image_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(image_path, "wb") as f:
-                            f.write(image_data)
-                    except Exception as e:
-                        logger.warning(f"Could not save image: {e}")
+                # Save to disk (in the background)
+                write_future = None
+                if save_to_disk and image_data:
+                    write_future = self._io_pool.submit(
+                        self._write_image, image_path, image_data, pil_img or None
+                    )
                 
                 # Get caption
                 caption = None
-                if hasattr(item, 'caption') and item.caption:
-                    caption = str(item.caption)
-                elif hasattr(item, 'text') and item.text:
-                    caption = item.text
+                item_caption = getattr(item, 'caption', None)
+                item_text = getattr(item, 'text', None)
+                if item_caption:
+                    caption = str(item_caption)
+                elif item_text:
+                    caption = item_text
                 
                 # Create ExtractedImage - no base64_data stored
                 extracted = ExtractedImage(
@@ -158,19 +312,52 @@ class DoclingImageExtractor:
                     image_format=image_ext,
                     width=width,
                     height=height,
-                    caption=caption
+                    caption=caption,
                     # base64_data is not stored - images are on disk
+                    pil_image=pil_img or None
                 )
-                images.append(extracted)
                 img_idx += 1
+                pending.append((write_future, extracted))
                 
-        except Exception as e:
-            logger.error(f"Error extracting images: {e}")
-            import traceback
-            traceback.print_exc()
+                # Hand over images whose writes have already landed
+                while pending and (pending[0][0] is None or pending[0][0].done()):
+                    yield self._finish_write(*pending.popleft())
+                
+        except Exception:
+            logger.exception("Error extracting images")
         
-        logger.info(f"Extracted {len(images)} images using Docling")
-        return images
+        while pending:
+            yield self._finish_write(*pending.popleft())
+    
+    def _get_converter(self):
+        """
+        Lazily build one shared Docling converter for picture extraction.
+        Docling model loading is expensive, so it is paid once per process.
+        """
+        if self._converter is not None:
+            return self._converter
+        
+        with self._converter_lock:
+            if self._converter is None:
+                from docling.document_converter import DocumentConverter
+                from docling.datamodel.pipeline_options import PdfPipelineOptions
+                from docling.datamodel.base_models import InputFormat
+                from docling.document_converter import PdfFormatOption
+                
+                # Enable picture extraction
+                pipeline_options = PdfPipelineOptions()
+                pipeline_options.do_table_structure = True
+                pipeline_options.images_scale = 2.0  # Higher resolution
+                pipeline_options.generate_picture_images = True
+                
+                self._converter = DocumentConverter(
+                    format_options={
+                        InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
+                    }
+                )
+                logger.info("Docling image converter initialized")
+        
+        return self._converter
     
     def extract_images_from_pdf(
         self, 
@@ -182,24 +369,7 @@ class DoclingImageExtractor:
         Direct extraction from PDF file using Docling with picture export.
         """
         try:
-            from docling.document_converter import DocumentConverter
-            from docling.datamodel.pipeline_options import PdfPipelineOptions
-            from docling.datamodel.base_models import InputFormat
-            from docling.document_converter import PdfFormatOption
-            
-            # Enable picture extraction
-            pipeline_options = PdfPipelineOptions()
-            pipeline_options.do_table_structure = True
-            pipeline_options.images_scale = 2.0  # Higher resolution
-            pipeline_options.generate_picture_images = True
-            
-            converter = DocumentConverter(
-                format_options={
-                    InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)
-                }
-            )
-            
-            result = converter.convert(pdf_path)
+            result = self._get_converter().convert(pdf_path)
             
             return self.extract_images_from_docling(
                 result.document, 
@@ -210,10 +380,8 @@ class DoclingImageExtractor:
         except ImportError as e:
             logger.error(f"Docling not installed: {e}")
             return []
-        except Exception as e:
-            logger.error(f"Error parsing PDF for images: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error parsing PDF for images")
             return []
     
     def associate_with_sections(
@@ -222,29 +390,24 @@ class DoclingImageExtractor:
         toc: List[TOCEntry]
     ) -> List[ExtractedImage]:
         """Associate images with sections."""
-        if not toc:
+        if not toc or not images:
             return images
         
-        for image in images:
-            for entry in toc:
-                page_end = entry.page_end or float('inf')
-                if entry.page_number <= image.page_number <= page_end:
-                    image.section_title = entry.title
-                    break
-        
+        ImageIndex(images).assign_sections(toc)
         return images
     
     def get_images_for_page_range(
         self,
-        images: List[ExtractedImage],
+        images: Union[List[ExtractedImage], ImageIndex],
         page_start: int,
         page_end: int
     ) -> List[ExtractedImage]:
-        """Get images within page range."""
-        return [
-            img for img in images 
-            if page_start <= img.page_number <= page_end
-        ]
+        """Get images within page range (pass an ImageIndex to reuse it across calls)."""
+        if not isinstance(images, ImageIndex):
+            if not images:
+                return []
+            images = ImageIndex(images)
+        return images.in_page_range(page_start, page_end)
     
     def load_image_as_pil(self, image: ExtractedImage) -> Optional[Image.Image]:
         """Load extracted image as PIL Image."""
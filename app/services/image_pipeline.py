@@ -0,0 +1,172 @@
+"""
+Batched image ingestion pipeline: Docling extract -> BGE-VL embed -> sink.
+Each stage runs on its own worker thread, connected by bounded queues,
+so Docling decoding, model inference and vector-store writes overlap.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+
+from app.schemas import ExtractedImage
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output stream
+_DONE = object()
+
+
+class ImageIngestionPipeline:
+    """
+    Three-stage producer/consumer pipeline for document images.
+
+    Stages:
+    1. Extract: iterate Docling pictures, save to disk, emit ExtractedImage
+    2. Embed: micro-batch images (size or time based) into embed_images_batch
+    3. Sink: collect (image, embedding) pairs, flush in larger batches
+
+    Embed and sink batch sizes are decoupled so each stage runs at its
+    natural granularity.
+    """
+
+    QUEUE_SIZE = 32
+    EMBED_BATCH_SIZE = 8
+    EMBED_FLUSH_SECONDS = 0.1
+    SINK_BATCH_SIZE = 64
+
+    def __init__(self, extractor, embedder):
+        self.extractor = extractor
+        self.embedder = embedder
+
+    def run(
+        self,
+        docling_doc,
+        document_id: str,
+        save_to_disk: bool = True,
+        category_id: str = "",
+        sink: Optional[Callable[[List[Tuple[ExtractedImage, np.ndarray]]], None]] = None
+    ) -> Tuple[List[ExtractedImage], Dict[str, np.ndarray]]:
+        """
+        Run the pipeline to completion.
+
+        Args:
+            docling_doc: Docling document object
+            document_id: Owning document ID
+            save_to_disk: Write extracted images to disk
+            category_id: Owning category ID
+            sink: Optional callback receiving batches of (image, embedding)
+
+        Returns:
+            (extracted images in document order, image_id -> embedding)
+        """
+        extracted_q: queue.Queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        embedded_q: queue.Queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+
+        images: List[ExtractedImage] = []
+        embeddings: Dict[str, np.ndarray] = {}
+        errors: List[Exception] = []
+
+        def extract_stage():
+            try:
+                for img in self.extractor.iter_images_from_docling(
+                    docling_doc, document_id, save_to_disk, category_id
+                ):
+                    images.append(img)
+                    extracted_q.put(img)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                extracted_q.put(_DONE)
+
+        def embed_stage():
+            batch: List[ExtractedImage] = []
+
+            def flush():
+                if not batch:
+                    return
+                try:
+                    # Prefer the decoded figure over re-reading it from disk
+                    vectors = self.embedder.embed_images_batch([
+                        img.pil_image if img.pil_image is not None else img.image_path
+                        for img in batch
+                    ])
+                except Exception as e:
+                    logger.error(f"Pipeline embedding failed: {e}")
+                    vectors = [None] * len(batch)
+                for img, vec in zip(batch, vectors):
+                    # Release the pixels once embedded; later stages use the file
+                    img.pil_image = None
+                    if vec is not None:
+                        embedded_q.put((img, vec))
+                batch.clear()
+
+            try:
+                deadline = None
+                while True:
+                    timeout = None
+                    if deadline is not None:
+                        timeout = max(0.0, deadline - time.monotonic())
+                    try:
+                        item = extracted_q.get(timeout=timeout)
+                    except queue.Empty:
+                        flush()
+                        deadline = None
+                        continue
+
+                    if item is _DONE:
+                        flush()
+                        break
+
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.EMBED_FLUSH_SECONDS
+                    if len(batch) >= self.EMBED_BATCH_SIZE:
+                        flush()
+                        deadline = None
+            except Exception as e:
+                errors.append(e)
+            finally:
+                embedded_q.put(_DONE)
+
+        def sink_stage():
+            pending: List[Tuple[ExtractedImage, np.ndarray]] = []
+
+            def flush():
+                if pending and sink is not None:
+                    try:
+                        sink(list(pending))
+                    except Exception as e:
+                        logger.error(f"Pipeline sink failed: {e}")
+                pending.clear()
+
+            while True:
+                item = embedded_q.get()
+                if item is _DONE:
+                    flush()
+                    break
+                img, vec = item
+                embeddings[img.image_id] = vec
+                pending.append(item)
+                if len(pending) >= self.SINK_BATCH_SIZE:
+                    flush()
+
+        workers = [
+            threading.Thread(target=extract_stage, name="img-extract", daemon=True),
+            threading.Thread(target=embed_stage, name="img-embed", daemon=True),
+            threading.Thread(target=sink_stage, name="img-sink", daemon=True),
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        if errors:
+            logger.error(f"Image pipeline finished with errors: {errors[0]}")
+
+        logger.info(
+            f"Image pipeline: {len(images)} extracted, {len(embeddings)} embedded"
+        )
+        return images, embeddings
@@ -10,18 +10,64 @@ from llama_index.core.schema import TextNode
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 
-from qdrant_client import QdrantClient
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, SparseVectorParams, SparseIndexParams, SparseVector
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct, SparseVectorParams, SparseIndexParams, SparseVector, OptimizersConfigDiff
+from qdrant_client.models import Filter, FieldCondition, MatchAny, MatchValue, Datatype
 from fastembed import SparseTextEmbedding
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from functools import lru_cache
+from hashlib import blake2b
+import asyncio
+import concurrent.futures
 import logging
+import threading
+
+import numpy as np
 
 from app.config.settings import get_settings
 from app.schemas import Chunk, RetrievedChunk
 
 logger = logging.getLogger(__name__)
 
+# Output dimension of common text embedding models, so startup needs no probe pass
+_KNOWN_DIMS = {
+    "BAAI/bge-small-en-v1.5": 384,
+    "BAAI/bge-base-en-v1.5": 768,
+    "BAAI/bge-large-en-v1.5": 1024,
+    "sentence-transformers/all-MiniLM-L6-v2": 384,
+    "sentence-transformers/all-mpnet-base-v2": 768,
+}
+
+
+def _stable_id(key: str) -> int:
+    """
+    Deterministic 63-bit Qdrant point ID for a string key.
+    Python's hash() is salted per process, so re-indexing after a restart
+    would otherwise create duplicate points instead of overwriting.
+    """
+    return int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "big") & ((1 << 63) - 1)
+
+
+# Node metadata hidden from both the embedder and the LLM
+_EXCLUDED_META_KEYS = ("chunk_id", "image_ids", "table_ids", "category_id")
+
+# PointStruct without pydantic validation: ids, vectors and payloads are all
+# built by this module from typed schemas, so re-checking them per point is waste
+_new_point = PointStruct.model_construct
+
+
+def _sparse_vector(embedding) -> SparseVector:
+    """
+    Build a SparseVector from a fastembed result without pydantic validation.
+    fastembed already guarantees int indices and float values, and per-element
+    strict-type checks dominate the cost for large ingests.
+    """
+    return SparseVector.model_construct(
+        indices=embedding.indices.tolist(),
+        values=embedding.values.tolist()
+    )
+
 
 class Indexer:
     """
@@ -29,15 +75,28 @@ class Indexer:
     Manages 3 collections: text chunks, tables, images.
     """
     
+    # Documents per fastembed BM25 call
+    SPARSE_BATCH_SIZE = 64
+    # Points per Qdrant upsert request, and async requests kept in flight
+    UPSERT_BATCH_SIZE = 128
+    UPSERT_CONCURRENCY = 4
+    
     def __init__(self):
         self.settings = get_settings()
         self.embed_model: Optional[HuggingFaceEmbedding] = None
         self.sparse_embed_model: Optional[SparseTextEmbedding] = None
         self.qdrant_client: Optional[QdrantClient] = None
+        self.aqdrant_client: Optional[AsyncQdrantClient] = None
         self.vector_store: Optional[QdrantVectorStore] = None
         self.index: Optional[VectorStoreIndex] = None
         self._initialized = False
         self._embedding_dim = 384
+        # Per-collection count of in-flight bulk loads with HNSW indexing paused
+        self._indexing_pauses: Dict[str, int] = {}
+        self._indexing_lock = threading.Lock()
+        self._collections_checked = False
+        # Retrievers keyed on (top_k, document_ids, category_ids); cleared when self.index changes
+        self._get_retriever = lru_cache(maxsize=64)(self._build_retriever)
     
     def initialize(self) -> None:
         """Initialize embedding model and Qdrant connection."""
@@ -46,14 +105,14 @@ class Indexer:
         
         logger.info(f"Loading embedding model: {self.settings.embedding_model}")
         self.embed_model = HuggingFaceEmbedding(
-            model_name=self.settings.embedding_model
+            model_name=self.settings.embedding_model,
+            embed_batch_size=self.settings.embed_batch_size
         )
         
         logger.info("Loading sparse embedding model: Qdrant/bm25")
         self.sparse_embed_model = SparseTextEmbedding(model_name="Qdrant/bm25")
         
-        test_embedding = self.embed_model.get_text_embedding("test")
-        self._embedding_dim = len(test_embedding)
+        self._embedding_dim = self._resolve_embedding_dim()
         logger.info(f"Embedding dimension: {self._embedding_dim}")
         
         LlamaSettings.embed_model = self.embed_model
@@ -63,14 +122,7 @@ class Indexer:
         )
         
         try:
-            if self.settings.qdrant_api_key:
-                self.qdrant_client = QdrantClient(
-                    url=self.settings.qdrant_url,
-                    api_key=self.settings.qdrant_api_key
-                )
-            else:
-                self.qdrant_client = QdrantClient(url=self.settings.qdrant_url)
-            
+            self._connect()
             self._ensure_collections()
             
             try:
@@ -86,24 +138,85 @@ class Indexer:
         except Exception as e:
             logger.warning(f"Qdrant connection failed: {e}")
             self.qdrant_client = None
+            self.aqdrant_client = None
             self.vector_store = None
         
         self._initialized = True
     
+    def _connect(self) -> None:
+        """
+        Create the sync and async Qdrant clients.
+        gRPC (protobuf) is preferred for its cheaper client-side serialization
+        of large upserts; if the gRPC port is unreachable, fall back to REST.
+        """
+        client_kwargs = {"url": self.settings.qdrant_url}
+        if self.settings.qdrant_api_key:
+            client_kwargs["api_key"] = self.settings.qdrant_api_key
+        
+        if self.settings.qdrant_prefer_grpc:
+            grpc_kwargs = {
+                **client_kwargs,
+                "prefer_grpc": True,
+                "grpc_port": self.settings.qdrant_grpc_port,
+            }
+            try:
+                client = QdrantClient(**grpc_kwargs)
+                client.get_collections()
+                self.qdrant_client = client
+                self.aqdrant_client = AsyncQdrantClient(**grpc_kwargs)
+                logger.info("Connected to Qdrant over gRPC")
+                return
+            except Exception as e:
+                logger.warning(f"Qdrant gRPC unavailable, using REST: {e}")
+        
+        self.qdrant_client = QdrantClient(**client_kwargs)
+        self.aqdrant_client = AsyncQdrantClient(**client_kwargs)
+    
+    def _resolve_embedding_dim(self) -> int:
+        """Embedding size from the known-model table or model config; probe only as a last resort."""
+        dim = _KNOWN_DIMS.get(self.settings.embedding_model)
+        if dim:
+            return dim
+        try:
+            dim = self.embed_model._model.get_sentence_embedding_dimension()
+        except Exception:
+            dim = None
+        return dim or len(self.embed_model.get_text_embedding("test"))
+    
+    async def aclose(self) -> None:
+        """Close the pooled Qdrant connections (called at shutdown)."""
+        if self.aqdrant_client:
+            try:
+                await self.aqdrant_client.close()
+            except Exception as e:
+                logger.warning(f"Error closing async Qdrant client: {e}")
+            self.aqdrant_client = None
+        if self.qdrant_client:
+            try:
+                self.qdrant_client.close()
+            except Exception as e:
+                logger.warning(f"Error closing Qdrant client: {e}")
+            self.qdrant_client = None
+        self._initialized = False
+        self._collections_checked = False
+    
     def _ensure_collections(self) -> None:
-        """Create Qdrant collections if they don't exist."""
-        import httpx
+        """Create Qdrant collections if they don't exist (checked once per process)."""
+        if self._collections_checked:
+            return
         
         try:
-            response = httpx.get(f"{self.settings.qdrant_url}/collections")
-            collection_data = response.json()
             collection_names = [
-                c["name"] for c in collection_data.get("result", {}).get("collections", [])
+                c.name for c in self.qdrant_client.get_collections().collections
             ]
         except Exception as e:
             logger.warning(f"Could not get collections: {e}")
             collection_names = []
         
+        # Half-width storage for new collections; Qdrant casts on ingest and
+        # widens at scoring time. Existing collections keep their datatype.
+        vector_datatype = Datatype.FLOAT16 if self.settings.qdrant_float16_vectors else None
+        
         # Text chunks collection (Hybrid)
         if self.settings.qdrant_collection not in collection_names:
             self.qdrant_client.create_collection(
@@ -111,7 +224,8 @@ class Indexer:
                 vectors_config={
                     "dense": VectorParams(
                         size=self._embedding_dim,
-                        distance=Distance.COSINE
+                        distance=Distance.COSINE,
+                        datatype=vector_datatype
                     )
                 },
                 sparse_vectors_config={
@@ -130,32 +244,26 @@ class Indexer:
         
         if image_collection in collection_names:
             try:
-                resp = httpx.get(
-                    f"{self.settings.qdrant_url}/collections/{image_collection}"
-                )
-                info = resp.json()
-                existing_dim = (
-                    info.get("result", {})
-                    .get("config", {})
-                    .get("params", {})
-                    .get("vectors", {})
-                    .get("size", 0)
-                )
+                info = self.qdrant_client.get_collection(image_collection)
+                vectors = info.config.params.vectors
+                existing_dim = getattr(vectors, "size", 0)
                 if existing_dim != image_dim:
                     logger.warning(
                         f"Image collection wrong dimension ({existing_dim}), recreating..."
                     )
-                    httpx.delete(
-                        f"{self.settings.qdrant_url}/collections/{image_collection}"
-                    )
+                    self.qdrant_client.delete_collection(image_collection)
                     collection_names.remove(image_collection)
-            except:
-                pass
+            except Exception as e:
+                logger.warning(f"Could not check image collection: {e}")
         
         if image_collection not in collection_names:
             self.qdrant_client.create_collection(
                 collection_name=image_collection,
-                vectors_config=VectorParams(size=image_dim, distance=Distance.COSINE)
+                vectors_config=VectorParams(
+                    size=image_dim,
+                    distance=Distance.COSINE,
+                    datatype=vector_datatype
+                )
             )
             logger.info(f"Created collection: {image_collection}")
         
@@ -167,7 +275,8 @@ class Indexer:
                 vectors_config={
                     "dense": VectorParams(
                         size=self._embedding_dim,
-                        distance=Distance.COSINE
+                        distance=Distance.COSINE,
+                        datatype=vector_datatype
                     )
                 },
                 sparse_vectors_config={
@@ -179,14 +288,39 @@ class Indexer:
                 }
             )
             logger.info(f"Created hybrid collection: {table_collection}")
+        
+        for name in (self.settings.qdrant_collection, image_collection, table_collection):
+            self._repair_indexing(name)
+        
+        self._collections_checked = True
+    
+    def _repair_indexing(self, collection_name: str) -> None:
+        """
+        Re-enable HNSW indexing left paused (indexing_threshold=0) by a bulk
+        load that never reached its resume, e.g. a crashed worker.
+        """
+        try:
+            info = self.qdrant_client.get_collection(collection_name)
+            if info.config.optimizer_config.indexing_threshold != 0:
+                return
+            logger.warning(f"Indexing was left paused on {collection_name}; restoring it")
+            self.qdrant_client.update_collection(
+                collection_name=collection_name,
+                optimizers_config=OptimizersConfigDiff(
+                    indexing_threshold=self.settings.qdrant_indexing_threshold
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Could not check indexing on {collection_name}: {e}")
     
     # ============================================
     # TEXT CHUNKS INDEXING
     # ============================================
     
-    def index_chunks(self, chunks: List[Chunk]) -> str:
+    def index_chunks(self, chunks: List[Chunk], bulk_load: bool = False) -> str:
         """
         Index text chunks (tables already removed from content).
+        bulk_load pauses HNSW indexing for the duration (see _with_indexing_paused).
         
         Metadata stored:
         - chunk_id, document_id, category_id
@@ -204,69 +338,230 @@ class Indexer:
             raise ValueError("No chunks to index")
         
         document_id = chunks[0].document_id
-        category_id = chunks[0].category_id
         
         if self.qdrant_client:
-            points = []
+            points = self._build_chunk_points(chunks)
+            self._write_points(self.settings.qdrant_collection, points, bulk_load)
             
-            for chunk in chunks:
-                embedding = self.embed_model.get_text_embedding(chunk.content)
-                
-                # Prepare IDs as comma-separated strings
-                image_ids_str = ",".join(chunk.image_ids) if chunk.image_ids else ""
-                table_ids_str = ",".join(chunk.table_ids) if chunk.table_ids else ""
-                
-                # Generate sparse embedding
-                sparse_gen = list(self.sparse_embed_model.embed([chunk.content]))[0]
-                sparse_vector = SparseVector(
-                    indices=sparse_gen.indices.tolist(),
-                    values=sparse_gen.values.tolist()
+            logger.info(f"Indexed {len(points)} chunks for {document_id}")
+            self._refresh_index()
+        else:
+            nodes = self._create_nodes_from_chunks(chunks)
+            self.index = VectorStoreIndex(nodes, embed_model=self.embed_model)
+            self._get_retriever.cache_clear()
+            logger.info(f"Indexed {len(nodes)} chunks in memory")
+        
+        return document_id
+    
+    async def aindex_chunks(self, chunks: List[Chunk], bulk_load: bool = False) -> str:
+        """
+        Async variant of index_chunks for the ingestion path.
+        
+        Embedding runs in worker threads and upsert batches are sent
+        through AsyncQdrantClient while later batches are still embedding.
+        """
+        if not self._initialized:
+            await asyncio.to_thread(self.initialize)
+        
+        if not chunks:
+            raise ValueError("No chunks to index")
+        
+        if not self.aqdrant_client:
+            return await asyncio.to_thread(self.index_chunks, chunks, bulk_load)
+        
+        document_id = chunks[0].document_id
+        count = await self._apipeline_chunks(self.settings.qdrant_collection, chunks, bulk_load)
+        
+        logger.info(f"Indexed {count} chunks for {document_id}")
+        await asyncio.to_thread(self._refresh_index)
+        return document_id
+    
+    async def _apipeline_chunks(
+        self, collection_name: str, chunks: List[Chunk], bulk_load: bool = False
+    ) -> int:
+        """
+        Pipelined embed -> upsert over minibatches of chunks.
+        
+        For each minibatch, dense (torch) and sparse (fastembed/ONNX) encoding
+        run side by side in worker threads; the finished points are upserted
+        in the background while the next minibatch is being embedded, so the
+        slowest stage sets the pace instead of the sum of all three.
+        """
+        batch_size = self.UPSERT_BATCH_SIZE
+        sem = asyncio.Semaphore(self.UPSERT_CONCURRENCY)
+        uploads = []
+        
+        async def upsert(points: List[PointStruct]) -> None:
+            async with sem:
+                await self.aqdrant_client.upsert(
+                    collection_name=collection_name,
+                    points=points
                 )
-
-                point = PointStruct(
-                    id=abs(hash(chunk.chunk_id)) % (2**63),
-                    vector={
-                        "dense": embedding,
-                        "sparse": sparse_vector
-                    },
-                    payload={
-                        "chunk_id": chunk.chunk_id,
-                        "document_id": document_id,
-                        "category_id": category_id,
-                        "text": chunk.content,
-                        "section_title": chunk.section_title,
-                        "page_start": chunk.page_start,
-                        "page_end": chunk.page_end,
-                        "image_ids": image_ids_str,
-                        "table_ids": table_ids_str,
-                        "has_images": len(chunk.image_ids) > 0,
-                        "has_tables": len(chunk.table_ids) > 0,
-                    }
+        
+        def embed_sparse(contents: List[str]) -> list:
+            return list(self.sparse_embed_model.embed(
+                contents, batch_size=self.SPARSE_BATCH_SIZE
+            ))
+        
+        pause = bulk_load and len(chunks) > batch_size
+        if pause:
+            await asyncio.to_thread(self._pause_indexing, collection_name)
+        try:
+            for start in range(0, len(chunks), batch_size):
+                batch = chunks[start:start + batch_size]
+                contents = [chunk.content for chunk in batch]
+                dense_embs, sparse_embs = await asyncio.gather(
+                    asyncio.to_thread(
+                        self.embed_model.get_text_embedding_batch,
+                        contents,
+                        show_progress=False
+                    ),
+                    asyncio.to_thread(embed_sparse, contents)
                 )
-                points.append(point)
+                points = self._chunk_points(batch, dense_embs, sparse_embs)
+                uploads.append(asyncio.create_task(upsert(points)))
             
-            # Batch upsert
-            batch_size = 100
+            await asyncio.gather(*uploads)
+        finally:
+            # Don't leave uploads running against a resumed collection on error
+            for task in uploads:
+                task.cancel()
+            if pause:
+                await asyncio.to_thread(self._resume_indexing, collection_name)
+        
+        return len(chunks)
+    
+    def _write_points(
+        self, collection_name: str, points: List[PointStruct], bulk_load: bool = False
+    ) -> None:
+        """Store points in batched upserts."""
+        with self._with_indexing_paused(
+            collection_name, bulk_load and len(points) > self.UPSERT_BATCH_SIZE
+        ):
+            batch_size = self.UPSERT_BATCH_SIZE
             for i in range(0, len(points), batch_size):
-                batch = points[i:i + batch_size]
                 self.qdrant_client.upsert(
-                    collection_name=self.settings.qdrant_collection,
-                    points=batch
+                    collection_name=collection_name,
+                    points=points[i:i + batch_size]
+                )
+    
+    @contextmanager
+    def _with_indexing_paused(self, collection_name: str, enabled: bool = True):
+        """
+        Defer HNSW graph building while a bulk load (a multi-batch document
+        from ingestion, or any caller passing bulk_load=True) runs.
+        indexing_threshold=0 stops incremental indexing; QDRANT_INDEXING_THRESHOLD
+        is restored on exit so the optimizer builds the index once.
+
+        The pause is collection-wide but counted per process, so run bulk
+        loads from one worker; a pause left behind by a crash is repaired
+        by _ensure_collections on the next start.
+        """
+        if not enabled:
+            yield
+            return
+        self._pause_indexing(collection_name)
+        try:
+            yield
+        finally:
+            self._resume_indexing(collection_name)
+    
+    def _pause_indexing(self, collection_name: str) -> None:
+        """Set indexing_threshold=0 when the first concurrent loader starts."""
+        with self._indexing_lock:
+            count = self._indexing_pauses.get(collection_name, 0)
+            self._indexing_pauses[collection_name] = count + 1
+            if count:
+                return
+            try:
+                self.qdrant_client.update_collection(
+                    collection_name=collection_name,
+                    optimizers_config=OptimizersConfigDiff(indexing_threshold=0)
+                )
+            except Exception as e:
+                logger.warning(f"Could not pause indexing on {collection_name}: {e}")
+    
+    def _resume_indexing(self, collection_name: str) -> None:
+        """Restore indexing_threshold once the last concurrent loader finishes."""
+        with self._indexing_lock:
+            count = self._indexing_pauses.get(collection_name, 1) - 1
+            if count > 0:
+                self._indexing_pauses[collection_name] = count
+                return
+            self._indexing_pauses.pop(collection_name, None)
+            # Restore the configured value, never one read back from the
+            # collection (another worker may already have set it to 0)
+            try:
+                self.qdrant_client.update_collection(
+                    collection_name=collection_name,
+                    optimizers_config=OptimizersConfigDiff(
+                        indexing_threshold=self.settings.qdrant_indexing_threshold
+                    )
                 )
+            except Exception as e:
+                logger.warning(f"Could not resume indexing on {collection_name}: {e}")
+    
+    def _build_chunk_points(self, chunks: List[Chunk]) -> List[PointStruct]:
+        """Embed chunks (dense + sparse) and build their Qdrant points."""
+        # One batched forward pass for all chunks instead of one per chunk
+        dense_embs = self.embed_model.get_text_embedding_batch(
+            [chunk.content for chunk in chunks], show_progress=False
+        )
+        
+        # Sparse BM25 embeddings streamed from a single batched call
+        sparse_embs = self.sparse_embed_model.embed(
+            [chunk.content for chunk in chunks], batch_size=self.SPARSE_BATCH_SIZE
+        )
+        
+        return self._chunk_points(chunks, dense_embs, sparse_embs)
+    
+    def _chunk_points(self, chunks: List[Chunk], dense_embs, sparse_embs) -> List[PointStruct]:
+        """Build Qdrant points for chunks from precomputed dense/sparse embeddings."""
+        document_id = chunks[0].document_id
+        category_id = chunks[0].category_id
+        points = []
+        
+        for chunk, embedding, sparse_gen in zip(chunks, dense_embs, sparse_embs):
             
-            logger.info(f"Indexed {len(points)} chunks for {document_id}")
+            # Prepare IDs as comma-separated strings
+            image_ids_str = ",".join(chunk.image_ids) if chunk.image_ids else ""
+            table_ids_str = ",".join(chunk.table_ids) if chunk.table_ids else ""
             
-            if self.vector_store:
-                self.index = VectorStoreIndex.from_vector_store(
-                    vector_store=self.vector_store,
-                    embed_model=self.embed_model
-                )
-        else:
-            nodes = self._create_nodes_from_chunks(chunks)
-            self.index = VectorStoreIndex(nodes, embed_model=self.embed_model)
-            logger.info(f"Indexed {len(nodes)} chunks in memory")
+            sparse_vector = _sparse_vector(sparse_gen)
+
+            point = _new_point(
+                id=_stable_id(chunk.chunk_id),
+                vector={
+                    "dense": embedding,
+                    "sparse": sparse_vector
+                },
+                payload={
+                    "chunk_id": chunk.chunk_id,
+                    "document_id": document_id,
+                    "category_id": category_id,
+                    "text": chunk.content,
+                    "section_title": chunk.section_title,
+                    "page_start": chunk.page_start,
+                    "page_end": chunk.page_end,
+                    "image_ids": image_ids_str,
+                    "table_ids": table_ids_str,
+                    "has_images": len(chunk.image_ids) > 0,
+                    "has_tables": len(chunk.table_ids) > 0,
+                }
+            )
+            points.append(point)
         
-        return document_id
+        return points
+    
+    def _refresh_index(self) -> None:
+        """Rebuild the LlamaIndex view over the Qdrant vector store."""
+        if self.vector_store:
+            self.index = VectorStoreIndex.from_vector_store(
+                vector_store=self.vector_store,
+                embed_model=self.embed_model
+            )
+            # Cached retrievers are bound to the previous index object
+            self._get_retriever.cache_clear()
     
     def _create_nodes_from_chunks(self, chunks: List[Chunk]) -> List[TextNode]:
         """Create LlamaIndex TextNodes from chunks."""
@@ -298,12 +593,8 @@ class Indexer:
                 text=content,
                 id_=chunk.chunk_id,
                 metadata=metadata,
-                excluded_embed_metadata_keys=[
-                    "chunk_id", "image_ids", "table_ids", "category_id"
-                ],
-                excluded_llm_metadata_keys=[
-                    "chunk_id", "image_ids", "table_ids", "category_id"
-                ]
+                excluded_embed_metadata_keys=list(_EXCLUDED_META_KEYS),
+                excluded_llm_metadata_keys=list(_EXCLUDED_META_KEYS)
             )
             nodes.append(node)
         
@@ -335,13 +626,20 @@ class Indexer:
         table_collection = f"{self.settings.qdrant_collection}_tables"
         points = []
         
-        for table in tables:
-            table_text = self._table_to_text(table)
-            if not table_text:
-                continue
-            
-            embedding = self.embed_model.get_text_embedding(table_text)
-            
+        table_texts = [(table, self._table_to_text(table)) for table in tables]
+        table_texts = [(table, text) for table, text in table_texts if text]
+        if not table_texts:
+            return 0
+        
+        dense_embs = self.embed_model.get_text_embedding_batch(
+            [text for _, text in table_texts], show_progress=False
+        )
+        
+        sparse_embs = self.sparse_embed_model.embed(
+            [text for _, text in table_texts], batch_size=self.SPARSE_BATCH_SIZE
+        )
+        
+        for (table, table_text), embedding, sparse_gen in zip(table_texts, dense_embs, sparse_embs):
             markdown = table.get("markdown_content") or table.get("markdown", "")
             
             row_count = table.get("row_count", 0)
@@ -353,15 +651,10 @@ class Indexer:
             if not section_title and "section" in table:
                 section_title = table["section"]
             
-            # Generate sparse embedding
-            sparse_gen = list(self.sparse_embed_model.embed([table_text]))[0]
-            sparse_vector = SparseVector(
-                indices=sparse_gen.indices.tolist(),
-                values=sparse_gen.values.tolist()
-            )
+            sparse_vector = _sparse_vector(sparse_gen)
             
-            point = PointStruct(
-                id=abs(hash(table.get("table_id", str(len(points))))) % (2**63),
+            point = _new_point(
+                id=_stable_id(table.get("table_id", str(len(points)))),
                 vector={
                     "dense": embedding,
                     "sparse": sparse_vector
@@ -380,10 +673,7 @@ class Indexer:
             points.append(point)
         
         if points:
-            self.qdrant_client.upsert(
-                collection_name=table_collection,
-                points=points
-            )
+            self._write_points(table_collection, points)
             logger.info(f"Indexed {len(points)} tables for {document_id}")
         
         return len(points)
@@ -426,12 +716,14 @@ class Indexer:
         points = []
         
         for img in images:
-            if not img.get("embedding"):
+            embedding = img.get("embedding")
+            if embedding is None or len(embedding) == 0:
                 continue
             
-            point = PointStruct(
-                id=hash(img["image_id"]) % (2**63),
-                vector=img["embedding"],
+            point = _new_point(
+                id=_stable_id(img["image_id"]),
+                # Embedder returns float32 arrays; Qdrant wants plain lists
+                vector=np.asarray(embedding, dtype=np.float32).tolist(),
                 payload={
                     "image_id": img["image_id"],
                     "document_id": document_id,
@@ -447,10 +739,7 @@ class Indexer:
             points.append(point)
         
         if points:
-            self.qdrant_client.upsert(
-                collection_name=image_collection,
-                points=points
-            )
+            self._write_points(image_collection, points)
             logger.info(f"Indexed {len(points)} images for {document_id}")
         
         return len(points)
@@ -459,55 +748,61 @@ class Indexer:
     # QUERYING
     # ============================================
     
-    def query(
+    def _build_retriever(
         self,
-        query_text: str,
-        top_k: int = get_settings().top_k,
-        document_ids: Optional[List[str]] = None,
-        category_ids: Optional[List[str]] = None
-    ) -> List[RetrievedChunk]:
-        """Query text chunks collection."""
-        if not self._initialized:
-            self.initialize()
-        
-        if not self.index:
-            if self.vector_store:
-                self.index = VectorStoreIndex.from_vector_store(
-                    vector_store=self.vector_store,
-                    embed_model=self.embed_model
-                )
-            else:
-                raise ValueError("Index not initialized")
-        
+        top_k: int,
+        document_ids: Tuple[str, ...],
+        category_ids: Tuple[str, ...]
+    ):
+        """Create a retriever over self.index for one (top_k, filter) combination."""
         filter_conditions = []
         
         if document_ids:
-            from qdrant_client.models import FieldCondition, MatchAny
             filter_conditions.append(
                 FieldCondition(
                     key="document_id",
-                    match=MatchAny(any=document_ids)
+                    match=MatchAny(any=list(document_ids))
                 )
             )
         
         if category_ids:
-            from qdrant_client.models import FieldCondition, MatchAny
             filter_conditions.append(
                 FieldCondition(
                     key="category_id",
-                    match=MatchAny(any=category_ids)
+                    match=MatchAny(any=list(category_ids))
                 )
             )
         
         if filter_conditions:
-            from qdrant_client.models import Filter
             qdrant_filter = Filter(must=filter_conditions)
-            retriever = self.index.as_retriever(
+            return self.index.as_retriever(
                 similarity_top_k=top_k,
                 vector_store_kwargs={"qdrant_filters": qdrant_filter}
             )
-        else:
-            retriever = self.index.as_retriever(similarity_top_k=top_k)
+        return self.index.as_retriever(similarity_top_k=top_k)
+    
+    def query(
+        self,
+        query_text: str,
+        top_k: int = get_settings().top_k,
+        document_ids: Optional[List[str]] = None,
+        category_ids: Optional[List[str]] = None
+    ) -> List[RetrievedChunk]:
+        """Query text chunks collection."""
+        if not self._initialized:
+            self.initialize()
+        
+        if not self.index:
+            if self.vector_store:
+                self._refresh_index()
+            else:
+                raise ValueError("Index not initialized")
+        
+        retriever = self._get_retriever(
+            top_k,
+            tuple(sorted(document_ids)) if document_ids else (),
+            tuple(sorted(category_ids)) if category_ids else ()
+        )
         
         nodes_with_scores = retriever.retrieve(query_text)
         
@@ -540,15 +835,11 @@ class Indexer:
         if not self.qdrant_client:
             return False
         
-        from qdrant_client.models import Filter, FieldCondition, MatchValue
-        
         filter_obj = Filter(
             must=[FieldCondition(key="document_id", match=MatchValue(value=document_id))]
         )
         
         try:
-            import concurrent.futures
-            
             # Execute deletions in parallel to reduce waiting time
             with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
                 futures = []
@@ -590,6 +881,40 @@ class Indexer:
             logger.error(f"Error deleting document: {e}")
             return False
 
+    
+    async def adelete_document(self, document_id: str) -> bool:
+        """
+        Async delete_document: the three collection deletes go out together
+        through AsyncQdrantClient, so the wait is one round-trip, not three.
+        """
+        if not self.aqdrant_client:
+            return await asyncio.to_thread(self.delete_document, document_id)
+        
+        filter_obj = Filter(
+            must=[FieldCondition(key="document_id", match=MatchValue(value=document_id))]
+        )
+        collections = [
+            self.settings.qdrant_collection,
+            f"{self.settings.qdrant_collection}_tables",
+            f"{self.settings.qdrant_collection}_images",
+        ]
+        
+        results = await asyncio.gather(
+            *[
+                self.aqdrant_client.delete(
+                    collection_name=collection,
+                    points_selector=filter_obj
+                )
+                for collection in collections
+            ],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"One of the collection deletions failed: {result}")
+        
+        logger.info(f"Deleted all vectors for document {document_id}")
+        return True
 
 # Global instance
 indexer = Indexer()
@@ -23,7 +23,10 @@ import json
 import os
 import pickle
 import re
+import threading
 import warnings
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
 warnings.filterwarnings("ignore")
 
 import numpy as np
@@ -31,6 +34,23 @@ import numpy as np
 
 _DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guard_model")
 
+# What _clean strips, applied in this order. Kept as sequential passes: each
+# rule sees the previous one's output (e.g. a bullet exposed once "$x$" is
+# blanked), and the encoder must get exactly the text guard_pipeline.py
+# trained on
+_CLEAN_PASSES = (
+    re.compile(r"\$[^$]*\$"),
+    re.compile(r"\[image[^\]]*\]", re.IGNORECASE),
+    re.compile(r"\[table[^\]]*\]", re.IGNORECASE),
+    re.compile(r"<[^>]+>"),
+    re.compile(r"https?://\S+"),
+    re.compile(r"^\s*[\*\-\·\•]\s*", re.MULTILINE),
+)
+_WS_RE = re.compile(r"\s+")
+
+# Cleaned questions whose P(relevant) is remembered per Guard
+_CACHE_SIZE = 4096
+
 
 class Guard:
     """
@@ -48,6 +68,8 @@ class Guard:
         model_dir: str        = _DEFAULT_MODEL_DIR,
         threshold: float | None = None,
     ):
+        self._cache: OrderedDict[str, float] = OrderedDict()
+        self._cache_lock = threading.Lock()
         self._load(model_dir, threshold)
 
     # ────────────────────────────────────────────────────────────
@@ -107,6 +129,15 @@ class Guard:
         with open(clf_path, "rb") as f:
             self._clf = pickle.load(f)
 
+        # Binary logistic regression: score P(relevant) directly as one
+        # float32 GEMV instead of predict_proba's (N, 2) array
+        coef = getattr(self._clf, "coef_", None)
+        if coef is not None and coef.shape[0] == 1:
+            self._coef = coef[0].astype(np.float32)
+            self._bias = np.float32(self._clf.intercept_[0])
+        else:
+            self._coef = None
+
         self._threshold = (
             threshold_override
             if threshold_override is not None
@@ -118,32 +149,81 @@ class Guard:
         except ImportError:
             raise ImportError("Run:  pip install sentence-transformers")
 
+        import torch
+
+        self._torch = torch
         self._encoder = SentenceTransformer(self._meta["encoder_name"])
+        self._encoder.eval()
+
+        # FP16 weights on GPU: ~2x faster encode, same decisions downstream
+        self._half = self._encoder.device.type == "cuda"
+        if self._half:
+            self._encoder = self._encoder.half()
 
     def _clean(self, text: str) -> str:
         if not isinstance(text, str):
             return ""
         text = text.lower()
-        text = re.sub(r"\$[^$]*\$",         " ", text)
-        text = re.sub(r"\[image[^\]]*\]",   " ", text, flags=re.IGNORECASE)
-        text = re.sub(r"\[table[^\]]*\]",   " ", text, flags=re.IGNORECASE)
-        text = re.sub(r"<[^>]+>",           " ", text)
-        text = re.sub(r"https?://\S+",      " ", text)
-        text = re.sub(r"^\s*[\*\-\·\•]\s*", " ", text, flags=re.MULTILINE)
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
+        for pattern in _CLEAN_PASSES:
+            text = pattern.sub(" ", text)
+        return _WS_RE.sub(" ", text).strip()
+
+    @contextmanager
+    def _inference(self):
+        torch = self._torch
+        autocast = (
+            torch.autocast(self._encoder.device.type, dtype=torch.float16)
+            if self._half else nullcontext()
+        )
+        with torch.inference_mode(), autocast:
+            yield
+
+    def _score(self, cleaned: list[str]) -> np.ndarray:
+        """P(relevant) for already-cleaned texts (one encoder pass)."""
+        with self._inference():
+            X = self._encoder.encode(
+                cleaned,
+                batch_size=32,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            )
+        # No-op when encode already returned float32 (the usual case)
+        X = np.asarray(X, dtype=np.float32)
+        if not X.flags.c_contiguous:
+            X = np.ascontiguousarray(X)
+
+        if self._coef is not None:
+            logits = X @ self._coef + self._bias
+            return 1.0 / (1.0 + np.exp(-logits))
+        return self._clf.predict_proba(X)[:, 1]
 
     def _predict_batch(self, questions: list[str]) -> list[dict]:
         cleaned = [self._clean(q) for q in questions]
-        X = self._encoder.encode(
-            cleaned,
-            batch_size=32,
-            convert_to_numpy=True,
-            normalize_embeddings=True,
-            show_progress_bar=False,
-        ).astype(np.float32)
-
-        probs    = self._clf.predict_proba(X)[:, 1]
+        probs   = np.empty(len(cleaned), dtype=np.float32)
+
+        # Repeat questions (retries, probes) skip the encoder entirely;
+        # duplicates within one batch are encoded once
+        misses: dict[str, list[int]] = {}
+        with self._cache_lock:
+            for i, text in enumerate(cleaned):
+                p = self._cache.get(text)
+                if p is None:
+                    misses.setdefault(text, []).append(i)
+                else:
+                    self._cache.move_to_end(text)
+                    probs[i] = p
+
+        if misses:
+            texts = list(misses)
+            scored = self._score(texts)
+            with self._cache_lock:
+                for text, p in zip(texts, scored):
+                    probs[misses[text]] = p
+                    self._cache[text] = float(p)
+                while len(self._cache) > _CACHE_SIZE:
+                    self._cache.popitem(last=False)
+
         relevant = probs >= self._threshold
 
         return [
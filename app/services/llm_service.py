@@ -3,17 +3,153 @@ LLM Service using an OpenAI-compatible provider (DeepInfra by default).
 Images sent as vision API format, NOT as base64 text in context.
 Uses the OpenAI SDK pointed at the configured LLM_BASE_URL.
 """
-from openai import AsyncOpenAI
-from typing import List, Optional, Dict, Any
+from openai import AsyncOpenAI, BadRequestError
+from typing import List, Optional, Dict, Any, Tuple, Union
+import asyncio
 import logging
 import base64
+import contextlib
+import functools
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
+import httpx
+import numpy as np
+from PIL import Image
+
+try:
+    # SIMD base64 encoder; drop-in replacement for the stdlib module
+    import pybase64 as b64
+except ImportError:
+    b64 = base64
+
+# HTTP/2 multiplexes concurrent streams over one connection; needs the h2 extra
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 from app.config.settings import get_settings
 from app.schemas import Chunk, ExtractedImage, RetrievedChunk
+from app.utils.image_utils import make_thumbnail_jpeg
 
 logger = logging.getLogger(__name__)
 
+# Serialises llm_inputs.log writes (and image-cache pruning) off the event loop
+_LOG_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-log")
+
+# Shared connection pool for all concurrent chat sessions. Idle connections
+# outlive the gap between chat turns (httpx drops them after 5s by default)
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=120.0)
+
+# Tokens kept free for system prompt, question and chat history when
+# budgeting retrieved context against LLM_MAX_PROMPT_TOKENS
+_PROMPT_RESERVE_TOKENS = 4096
+
+
+@functools.lru_cache(maxsize=1)
+def _token_encoding():
+    """cl100k_base tokenizer, or None if tiktoken can't load it."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable ({e}); estimating context tokens from length")
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _count_tokens(text: str) -> int:
+    """Token count of a chunk; memoised since the same chunks recur across turns."""
+    if not text:
+        return 0
+    enc = _token_encoding()
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
+
+
+# Streamed deltas are merged until this many characters or seconds pile up
+_STREAM_FLUSH_CHARS = 16
+_STREAM_FLUSH_SECONDS = 0.01
+# Deltas the network reader may run ahead of a slow downstream consumer
+_STREAM_PREFETCH = 64
+_STREAM_END = object()
+
+
+async def _prefetch_deltas(stream):
+    """
+    Yield delta texts from a chat-completions stream that a background task
+    reads ahead into a bounded queue, so a slow SSE client doesn't stall the
+    upstream connection (and a slow upstream doesn't idle the writer).
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_STREAM_PREFETCH)
+
+    async def produce() -> None:
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        await queue.put(content)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_STREAM_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Consumer stopped early (client gone, error): stop reading upstream
+        producer.cancel()
+        close = getattr(stream, "close", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception:
+                pass
+
+
+async def _coalesce_deltas(stream):
+    """
+    Yield the text of a chat-completions stream in small merged batches
+    rather than one yield (and one downstream SSE frame) per token.
+    """
+    loop = asyncio.get_running_loop()
+    buf: List[str] = []
+    size = 0
+    last = loop.time()
+    # aclosing: an abandoned stream stops its reader task right away
+    async with contextlib.aclosing(_prefetch_deltas(stream)) as deltas:
+        async for content in deltas:
+            buf.append(content)
+            size += len(content)
+            now = loop.time()
+            if size >= _STREAM_FLUSH_CHARS or now - last >= _STREAM_FLUSH_SECONDS:
+                yield "".join(buf)
+                buf.clear()
+                size = 0
+                last = now
+    if buf:
+        yield "".join(buf)
+
 
 # ============================================================
 # CENTRALISED PROMPT TEMPLATES
@@ -221,6 +357,511 @@ Always respond in the **same language as the user's question**.
 - Never cite a retrieved document as the source of something you observed directly in the uploaded image.
 """
 
+
+# User turns shared by the blocking and streaming multimodal paths, so both
+# send byte-identical prompts
+_UPLOADED_IMAGES_USER = """\
+## Uploaded Images for Analysis
+The user has uploaded {n_images} image(s). These are shown below and are the PRIMARY subject of the question.
+
+## User Question
+{query}"""
+
+_IMAGES_UNAVAILABLE_USER = """\
+Note: Images are referenced but could not be rendered in this mode.
+
+Question: {query}"""
+
+
+# Preassembled system message for image analysis; shared by every call,
+# so never mutate it
+_SYS_IMAGE_ANALYSIS = {"role": "system", "content": _IMAGE_ANALYSIS_SYSTEM}
+
+
+def _context_order(context_chunks: List[RetrievedChunk]) -> List[RetrievedChunk]:
+    """
+    Context in rank order (best chunk first), with duplicates (same id, or
+    same content when the id is empty) dropped, keeping the best-ranked
+    copy. The rerank is deterministic, so the same retrieval still
+    serialises to the same prompt bytes.
+    """
+    seen = set()
+    unique = []
+    for c in context_chunks:
+        key = c.chunk_id or c.content
+        if key not in seen:
+            seen.add(key)
+            unique.append(c)
+    return unique
+
+
+# Explicit prompt-cache breakpoint for providers that honour it
+_CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+
+# Confirmed cache_control rejections before the markers are turned off
+_CACHE_CONTROL_MAX_REJECTIONS = 3
+
+# What providers say when they reject cache_control or content-part messages
+_CACHE_CONTROL_REJECTION_RE = re.compile(
+    r"cache_control|content.{0,40}(?:must be|expected).{0,20}string|content part",
+    re.IGNORECASE,
+)
+
+
+def _is_cache_control_rejection(error: BadRequestError) -> bool:
+    """True when a 400 is about the cache markers, not the request itself."""
+    return bool(_CACHE_CONTROL_REJECTION_RE.search(f"{getattr(error, 'body', '')} {error}"))
+
+
+def _flatten_system(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Messages without cache_control markers, for providers that reject them:
+    system parts are joined back into plain strings, marked history turns
+    unwrapped to their text.
+    """
+    flat = []
+    for msg in messages:
+        content = msg["content"]
+        if isinstance(content, list) and any("cache_control" in part for part in content):
+            msg = {"role": msg["role"], "content": "\n\n".join(part["text"] for part in content)}
+        flat.append(msg)
+    return flat
+
+
+@functools.lru_cache(maxsize=128)
+def _system_with_context(prompt: str, context: str) -> str:
+    """
+    System prompt + context as one stable prefix. The query is sent as its
+    own user turn so provider-side prefix (KV) caches survive follow-ups.
+    Memoised: follow-ups over a cached context reuse the same string.
+    """
+    return f"{prompt}\n\n## CONTEXT\n{context}"
+
+
+# data: URL prefix for the payload _resize_image produces at each detail
+# level; joined with + so the multi-MB base64 body skips str.format
+_PNG_DATA_URL_PREFIX = "data:image/png;base64,"
+_JPEG_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+_DETAIL_DATA_URL_PREFIX = {"low": _JPEG_DATA_URL_PREFIX, "high": _PNG_DATA_URL_PREFIX}
+
+
+def _encode_image(image_path: str, max_width: int, detail: str) -> bytes:
+    """
+    Decode, downscale and base64-encode one image.
+
+    "low" (retrieved reference images) takes a cheap BILINEAR thumbnail and
+    JPEG; "high" (user uploads) keeps LANCZOS + lossless PNG.
+    """
+    with Image.open(image_path) as img:
+        if detail == "low":
+            img.draft("RGB", (max_width, max_width))
+            return b64.b64encode(make_thumbnail_jpeg(img, max_width))
+
+        # PNG can't hold CMYK, and LA / I / I;16 / F would ship alpha or
+        # 16-32 bit samples the model never sees; plain grayscale stays 1-channel
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        if img.width > max_width:
+            # In place (no second full-size buffer); JPEGs are draft-decoded at
+            # reduced scale and reducing_gap box-reduces before the LANCZOS step
+            img.thumbnail((max_width, 1 << 30), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            logger.debug(f"Resized {os.path.basename(image_path)} → {img.width}×{img.height}")
+
+        buf = io.BytesIO()
+        img.save(buf, format="png")
+        # getbuffer() is a view: the PNG bytes aren't copied out of the buffer
+        return b64.b64encode(buf.getbuffer())
+
+
+def _content_digest(image_path: str) -> str:
+    """SHA1 of the first 64 KiB plus the file size: cheap, content-addressed."""
+    with open(image_path, "rb") as f:
+        digest = hashlib.sha1(f.read(65536))
+        digest.update(str(os.fstat(f.fileno()).st_size).encode())
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=256)
+def _resize_image_cached(
+    image_path: str,
+    mtime: float,
+    max_width: int,
+    detail: str = "high",
+    cache_dir: Optional[str] = None,
+    cache_max_bytes: int = 0,
+) -> str:
+    """
+    Base64 payload for one image. Keyed on mtime so a file rewritten in
+    place is re-encoded; repeat turns reuse the in-process payload, already
+    decoded to str so no turn pays for another multi-MB bytes→str copy.
+
+    With cache_dir, payloads are also kept on disk by content digest, so
+    they survive restarts and are shared between worker processes; the
+    directory is kept near cache_max_bytes (see _note_image_cache_write).
+    """
+    if not cache_dir:
+        return _encode_image(image_path, max_width, detail).decode("ascii")
+
+    cache_file = os.path.join(cache_dir, f"{_content_digest(image_path)}_{max_width}_{detail}.b64")
+    try:
+        with open(cache_file, "rb") as f:
+            os.utime(cache_file)  # recency for _prune_image_cache
+            return f.read().decode("ascii")
+    except FileNotFoundError:
+        pass
+
+    data = _encode_image(image_path, max_width, detail)
+    try:
+        # Write-then-rename so concurrent workers never read a partial file
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        os.replace(tmp_file, cache_file)
+        _note_image_cache_write(cache_dir, cache_max_bytes, len(data))
+    except OSError as e:
+        logger.debug(f"Could not cache image payload {cache_file}: {e}")
+    return data.decode("ascii")
+
+
+# Bytes this process has written to the image cache since its last prune
+_image_cache_written = 0
+_image_cache_lock = threading.Lock()
+
+
+def _note_image_cache_write(cache_dir: str, max_bytes: int, nbytes: int) -> None:
+    """
+    Queue a prune on the log thread after every max_bytes / 8 written, so a
+    long-running process keeps the cache within ~12% of LLM_IMAGE_CACHE_MAX_MB.
+    """
+    global _image_cache_written
+    if max_bytes <= 0:
+        return
+    with _image_cache_lock:
+        _image_cache_written += nbytes
+        if _image_cache_written < max_bytes // 8:
+            return
+        _image_cache_written = 0
+    _LOG_EXECUTOR.submit(_prune_image_cache, Path(cache_dir), max_bytes)
+
+
+def _prune_image_cache(cache_dir: Path, max_bytes: int) -> None:
+    """Delete least recently used payloads until the cache fits max_bytes."""
+    try:
+        entries = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(cache_dir) if e.is_file()]
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= max_bytes:
+            break
+    logger.info(f"Pruned LLM image cache to {total / 1e6:.0f} MB")
+
+
+# ============================================================
+# CONTEXT SERIALISATION
+# Follow-up turns usually reuse the same retrieval set, so the context JSON
+# is memoised on a hashable snapshot of exactly the fields it is built from.
+# ============================================================
+
+def _chunk_key(context_chunks: List[RetrievedChunk]) -> tuple:
+    return tuple(
+        (
+            chunk.doc_filename,
+            chunk.section_title,
+            chunk.page_start,
+            chunk.page_end,
+            chunk.content,
+            len(chunk.image_ids),
+        )
+        for chunk in _context_order(context_chunks)
+    )
+
+
+def _table_key(tables: Optional[List[Any]]) -> tuple:
+    key = []
+    for i, table in enumerate(tables or (), 1):
+        if isinstance(table, dict):
+            key.append((
+                table.get("doc_filename", f"Table {i}"),
+                table.get("section_title", ""),
+                table.get("page_number", "?"),
+                table.get("markdown", "") or str(table),
+            ))
+        else:
+            key.append((
+                getattr(table, "doc_filename", f"Table {i}"),
+                table.section_title,
+                table.page_number,
+                table.markdown_content,
+            ))
+    return tuple(key)
+
+
+def _image_key(retrieved_images: List[ExtractedImage]) -> tuple:
+    key = []
+    for i, img in enumerate(retrieved_images, 1):
+        image_name = os.path.basename(img.image_path or "")
+        key.append((
+            # doc_filename is not an ExtractedImage field; set by some callers
+            getattr(img, "doc_filename", None) or image_name,
+            img.section_title or "Unknown section",
+            img.page_number,
+            image_name or f"Image_{i}",
+            img.caption or "",
+            img.analysis,
+        ))
+    return tuple(key)
+
+
+def _fmt_chunk(i: int, fields: tuple) -> Dict[str, Any]:
+    doc_filename, section_title, page_start, page_end, content, n_images = fields
+    return {
+        "type": "text",
+        "source_file": doc_filename or f"Source {i}",
+        "section_title": section_title or "",
+        "pages": f"{page_start}–{page_end}",
+        "content": content,
+        "note": f"[Contains {n_images} image(s)]" if n_images else None,
+    }
+
+
+def _fmt_table(fields: tuple) -> Dict[str, Any]:
+    doc_filename, title, page, content = fields
+    return {"source_file": doc_filename, "section_title": title, "page": page, "content": content}
+
+
+def _fmt_image(fields: tuple) -> Dict[str, Any]:
+    doc_filename, title, page, image_name, caption, analysis = fields
+    img_data = {
+        "source_file": doc_filename,
+        "section_title": title,
+        "page": page,
+        "image_name": image_name,
+    }
+    if caption:
+        img_data["caption"] = caption
+    if analysis:
+        img_data["analysis"] = analysis
+    elif not caption:
+        img_data["note"] = "No textual analysis available — refer to the visual below."
+    return img_data
+
+
+def _context_entries(chunk_key: tuple) -> List[Dict[str, Any]]:
+    return [_fmt_chunk(i, fields) for i, fields in enumerate(chunk_key, 1)]
+
+
+# No whitespace after , and : (the model doesn't need it; every space is prompt)
+_COMPACT = (",", ":")
+
+
+@functools.lru_cache(maxsize=128)
+def _context_json(chunk_key: tuple) -> str:
+    if not chunk_key:
+        return json.dumps({"context": []})
+    return json.dumps({"context": _context_entries(chunk_key)}, ensure_ascii=False, separators=_COMPACT)
+
+
+@functools.lru_cache(maxsize=128)
+def _multimodal_context_json(chunk_key: tuple, table_key: tuple, image_key: tuple) -> str:
+    context_data = {
+        "context": _context_entries(chunk_key),
+        "tables": [_fmt_table(fields) for fields in table_key],
+        "images": [_fmt_image(fields) for fields in image_key],
+    }
+    return json.dumps(context_data, ensure_ascii=False, separators=_COMPACT)
+
+
+# ============================================================
+# RESPONSE CACHE
+# A user re-asking the same question over the same retrieval set gets the
+# previous answer back instead of another full completion.
+# ============================================================
+
+# Above this temperature answers are meant to vary; nothing is cached
+_RESPONSE_CACHE_MAX_TEMPERATURE = 0.3
+
+
+def _response_key(
+    model: str,
+    prompt: str,
+    query: str,
+    context_chunks: List[RetrievedChunk],
+    chat_history: Optional[List[Dict[str, str]]],
+) -> bytes:
+    parts = [model, prompt, query, *(chunk.chunk_id or chunk.content for chunk in context_chunks)]
+    for msg in chat_history or ():
+        parts += (msg["role"], msg["content"])
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).digest()
+
+
+def _chunk_set_key(
+    model: str,
+    prompt: str,
+    context_chunks: List[RetrievedChunk],
+    chat_history: Optional[List[Dict[str, str]]],
+) -> bytes:
+    """Everything but the query; chunk order doesn't matter, the set does."""
+    parts = [model, prompt, *sorted(chunk.chunk_id or chunk.content for chunk in context_chunks)]
+    for msg in chat_history or ():
+        parts += (msg["role"], msg["content"])
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).digest()
+
+
+class _ResponseCache:
+    """LRU of recent answers, each valid for ttl seconds."""
+
+    def __init__(self, ttl: float, maxsize: int = 512):
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._entries: OrderedDict[bytes, Tuple[float, str]] = OrderedDict()
+
+    def get(self, key: bytes) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, answer = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def put(self, key: bytes, answer: str) -> None:
+        self._entries[key] = (time.monotonic() + self._ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+
+class _SemanticResponseCache:
+    """
+    Answers for paraphrased questions: per retrieved chunk set, recent
+    (unit query embedding, answer) pairs; a hit needs cosine >= threshold.
+    """
+
+    def __init__(self, ttl: float, threshold: float, maxsize: int = 512, per_set: int = 8):
+        self._ttl = ttl
+        self._threshold = threshold
+        self._maxsize = maxsize
+        self._per_set = per_set
+        self._sets: OrderedDict[bytes, List[Tuple[float, np.ndarray, str]]] = OrderedDict()
+
+    def get(self, set_key: bytes, query_vec: np.ndarray) -> Optional[str]:
+        entries = self._sets.get(set_key)
+        if not entries:
+            return None
+        now = time.monotonic()
+        entries[:] = [entry for entry in entries if entry[0] >= now]
+        if not entries:
+            del self._sets[set_key]
+            return None
+        sims = np.stack([vec for _, vec, _ in entries]) @ query_vec
+        best = int(np.argmax(sims))
+        if sims[best] < self._threshold:
+            return None
+        self._sets.move_to_end(set_key)
+        return entries[best][2]
+
+    def put(self, set_key: bytes, query_vec: np.ndarray, answer: str) -> None:
+        entries = self._sets.setdefault(set_key, [])
+        entries.append((time.monotonic() + self._ttl, query_vec, answer))
+        del entries[:-self._per_set]
+        self._sets.move_to_end(set_key)
+        while len(self._sets) > self._maxsize:
+            self._sets.popitem(last=False)
+
+
+# ============================================================
+# CHAT TITLES
+# ============================================================
+
+_TITLE_SYSTEM = (
+    "You are an AI assistant specialized in summarizing conversations into highly concise titles. "
+    "Your task is to provide a 3 to 5 word title for the chat based on the user's first message to you. "
+    "RULES:\n"
+    "- Output ONLY the title itself.\n"
+    "- NO quotes, NO punctuation at the end, NO introduction.\n"
+    "- Ignore the `<think>` process, just output the final title.\n"
+    "- Do not explain your reasoning."
+)
+
+_SYS_TITLE = {"role": "system", "content": _TITLE_SYSTEM}
+
+# <think>...</think> blocks (possibly unterminated) from reasoning models
+_THINK_RE = re.compile(r'<think>.*?(?:</think>|$)', re.DOTALL)
+
+
+def _title_exchange(first_user_message: str, first_assistant_reply: str) -> str:
+    assistant_reply = ""
+    if first_assistant_reply:
+        assistant_reply = f"\nAssistant: {first_assistant_reply}"
+    return (
+        f"User: {first_user_message}\n"
+        f"Assistant: {assistant_reply}"
+    )
+
+
+def _clean_title(raw_title: Optional[str]) -> str:
+    title = _THINK_RE.sub("", raw_title or "")
+    title = title.strip().strip('"').strip("'").strip()
+    # If the model still outputs something like "Title: ...", strip it
+    if title.lower().startswith("title:"):
+        title = title[6:].strip()
+    return title if title else "New Chat"
+
+
+class _TitleBatcher:
+    """
+    Micro-batcher for chat titles. New sessions tend to arrive in bursts;
+    requests submitted within one short window share a single completion
+    call. A lone request is sent exactly as before.
+    """
+
+    def __init__(self, request_titles, window: float = 0.05, max_batch: int = 16):
+        self._request_titles = request_titles
+        self._window = window
+        self._max_batch = max_batch
+        self._pending: List[tuple] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def submit(self, first_user_message: str, first_assistant_reply: str) -> str:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((future, (first_user_message, first_assistant_reply)))
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_window())
+        return await future
+
+    async def _flush_after_window(self) -> None:
+        await asyncio.sleep(self._window)
+        batch, self._pending = self._pending, []
+        self._flush_task = None
+        await asyncio.gather(*(
+            self._resolve(batch[i:i + self._max_batch])
+            for i in range(0, len(batch), self._max_batch)
+        ))
+
+    async def _resolve(self, batch: List[tuple]) -> None:
+        try:
+            titles = await self._request_titles([exchange for _, exchange in batch])
+        except Exception as e:
+            logger.error(f"Error generating chat titles: {e}")
+            titles = ["New Chat"] * len(batch)
+        for (future, _), title in zip(batch, titles):
+            if not future.done():
+                future.set_result(title)
+
+
 class LLMService:
     """
     LLM service using an OpenAI-compatible API (DeepInfra by default).
@@ -230,208 +871,374 @@ class LLMService:
     def __init__(self):
         self.settings = get_settings()
         self.client: Optional[AsyncOpenAI] = None
+        self._http: Optional[httpx.AsyncClient] = None
         self.model = self.settings.llm_model
+        self._title_batcher = _TitleBatcher(self._request_titles)
+        self._image_cache_dir: Optional[str] = None
+        self._image_cache_max_bytes = self.settings.llm_image_cache_max_mb * 1024 * 1024
+        # Anthropic-compatible endpoints only cache on explicit breakpoints;
+        # OpenAI-style providers prefix-cache the verbatim system message
+        self._cache_control = (
+            self.settings.llm_prompt_cache_control
+            or "anthropic" in self.settings.llm_base_url.lower()
+        )
+        self._cache_control_rejections = 0
+        # Process-wide cap on concurrent completion requests (see _complete)
+        self._request_semaphore = asyncio.Semaphore(max(1, self.settings.llm_max_concurrency))
+        self._response_cache = (
+            _ResponseCache(self.settings.llm_response_cache_ttl)
+            if self.settings.llm_enable_response_cache
+            and self.settings.llm_response_cache_ttl > 0
+            and self.settings.llm_temperature <= _RESPONSE_CACHE_MAX_TEMPERATURE
+            else None
+        )
+        self._semantic_cache = (
+            _SemanticResponseCache(
+                self.settings.llm_response_cache_ttl, self.settings.llm_semantic_cache_threshold
+            )
+            if self._response_cache is not None and self.settings.llm_semantic_cache
+            else None
+        )
+        # Query embedder for the semantic cache; see set_embed_model
+        self._embed_model = None
+        # llm_inputs.log, opened and written only on the _LOG_EXECUTOR thread.
+        # Each counter has a single writer (event loop / log thread)
+        self._log_file = None
+        self._log_queued = 0
+        self._log_written = 0
+        # Prompt window left for retrieved content after the completion and
+        # the system prompt / question / history reserve
+        self._context_budget = (
+            self.settings.llm_max_prompt_tokens - self.settings.llm_max_tokens - _PROMPT_RESERVE_TOKENS
+            if self.settings.llm_max_prompt_tokens > 0 else 0
+        )
 
     def initialize(self) -> None:
         """Initialize the LLM client via OpenAI SDK."""
+        if self.settings.llm_image_cache_max_mb > 0:
+            cache_dir = self.settings.cache_dir / "llm_images"
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            _prune_image_cache(cache_dir, self._image_cache_max_bytes)
+            self._image_cache_dir = str(cache_dir)
+
         if not self.settings.llm_api_key:
             logger.warning("LLM API key not configured (LLM_API_KEY)")
             return
 
+        # One keep-alive pool for the process: streams reuse TLS connections
+        # instead of handshaking per request
+        self._http = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=_HTTP_LIMITS,
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
         self.client = AsyncOpenAI(
             api_key=self.settings.llm_api_key,
             base_url=self.settings.llm_base_url,
+            http_client=self._http,
+            # 429 / 5xx / connection errors: exponential backoff from 0.5s,
+            # honouring Retry-After
+            max_retries=3,
+        )
+        logger.info(
+            f"Initialized LLM client (model: {self.model}, base_url: {self.settings.llm_base_url}, "
+            f"http2: {HTTP2_AVAILABLE})"
         )
-        logger.info(f"Initialized LLM client (model: {self.model}, base_url: {self.settings.llm_base_url})")
+
+    def _system_message(self, prompt: str, context: Optional[str] = None) -> Dict[str, Any]:
+        """
+        System message carrying prompt (+ context, for RAG calls). With
+        LLM_PROMPT_CACHE_CONTROL the two are separate parts, each marked as a
+        cache breakpoint, so the prompt stays cached even when the context
+        changes.
+        """
+        if not self._cache_control:
+            if context is None:
+                return {"role": "system", "content": prompt}
+            return {"role": "system", "content": _system_with_context(prompt, context)}
+        parts = [{"type": "text", "text": prompt, "cache_control": _CACHE_BREAKPOINT}]
+        if context is not None:
+            parts.append({"type": "text", "text": f"## CONTEXT\n{context}", "cache_control": _CACHE_BREAKPOINT})
+        return {"role": "system", "content": parts}
+
+    def _history_messages(self, chat_history: Optional[List[Dict[str, str]]]) -> List[Dict[str, Any]]:
+        """
+        Prior turns as role/content messages. With LLM_PROMPT_CACHE_CONTROL
+        the newest turn carries a cache breakpoint, so the next request reuses
+        the whole conversation prefix instead of only the system prompt.
+        """
+        history = [{"role": msg["role"], "content": msg["content"]} for msg in chat_history or ()]
+        if self._cache_control and history:
+            last = history[-1]
+            last["content"] = [{"type": "text", "text": last["content"], "cache_control": _CACHE_BREAKPOINT}]
+        return history
+
+    async def _complete(self, messages: List[Dict[str, Any]], **kwargs):
+        """
+        chat.completions.create for this model, at most LLM_MAX_CONCURRENCY
+        requests in flight (for streams: until the response headers arrive).
+        If the provider rejects cache_control parts, retry with plain system
+        strings; after repeated rejections stop sending the markers.
+        """
+        async with self._request_semaphore:
+            try:
+                return await self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+            except BadRequestError as e:
+                if not (self._cache_control and _is_cache_control_rejection(e)):
+                    raise
+                logger.warning(f"Provider rejected cache_control markers ({e}); retrying with plain prompts")
+                response = await self.client.chat.completions.create(
+                    model=self.model, messages=_flatten_system(messages), **kwargs
+                )
+                # The plain retry went through, so the markers were the problem;
+                # only a repeated pattern turns them off for the process
+                self._cache_control_rejections += 1
+                if self._cache_control_rejections >= _CACHE_CONTROL_MAX_REJECTIONS:
+                    logger.warning("Disabling cache_control markers: provider keeps rejecting them")
+                    self._cache_control = False
+                return response
+
+    def set_embed_model(self, embed_model) -> None:
+        """Share the indexer's text embedder for semantic cache lookups."""
+        self._embed_model = embed_model
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        vec = np.asarray(self._embed_model.get_query_embedding(query), dtype=np.float32)
+        return vec / (np.linalg.norm(vec) or 1.0)
+
+    async def _cached_answer(
+        self,
+        prompt: str,
+        query: str,
+        context_chunks: List[RetrievedChunk],
+        chat_history: Optional[List[Dict[str, str]]],
+    ) -> Tuple[Optional[str], Optional[tuple]]:
+        """
+        Cached answer for this request, if any: exact match first, then a
+        paraphrase over the same chunk set. The second item is the handle
+        _store_answer needs on a miss (None when caching is off, or when a
+        chunk has no id and the context can't be identified reliably).
+        """
+        if self._response_cache is None or not all(chunk.chunk_id for chunk in context_chunks):
+            return None, None
+        key = _response_key(self.model, prompt, query, context_chunks, chat_history)
+        answer = self._response_cache.get(key)
+        if answer is not None or self._semantic_cache is None or self._embed_model is None:
+            return answer, (key, None, None)
+
+        set_key = _chunk_set_key(self.model, prompt, context_chunks, chat_history)
+        try:
+            query_vec = await asyncio.to_thread(self._embed_query, query)
+        except Exception as e:
+            logger.debug(f"Semantic cache lookup skipped: {e}")
+            return None, (key, None, None)
+        return self._semantic_cache.get(set_key, query_vec), (key, set_key, query_vec)
+
+    def _store_answer(self, handle: Optional[tuple], answer: Optional[str]) -> None:
+        if handle is None or not answer:
+            return
+        key, set_key, query_vec = handle
+        self._response_cache.put(key, answer)
+        if set_key is not None:
+            self._semantic_cache.put(set_key, query_vec, answer)
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections and the request log."""
+        await asyncio.wrap_future(_LOG_EXECUTOR.submit(self._close_log))
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    # ----------------------------------------------------------
+    # HELPER: keep the context inside the model's prompt window
+    # ----------------------------------------------------------
+    def _fit_budget(self, context_chunks: List[RetrievedChunk]) -> List[RetrievedChunk]:
+        """
+        Drop the lowest-ranked chunks once their content exceeds the context
+        token budget. Chunks arrive best-first, so the cut keeps the most
+        relevant ones.
+        """
+        budget = self._context_budget
+        if budget <= 0:
+            return context_chunks
+
+        used = 0
+        for i, chunk in enumerate(context_chunks):
+            used += _count_tokens(chunk.content)
+            if used > budget:
+                logger.warning(
+                    f"Context over budget ({budget} tokens): keeping {i} of {len(context_chunks)} chunks"
+                )
+                return context_chunks[:i]
+        return context_chunks
 
     # ----------------------------------------------------------
     # HELPER: build text-only context string from chunks
     # ----------------------------------------------------------
-    @staticmethod
-    def _build_context(context_chunks: List[RetrievedChunk]) -> str:
+    def _build_context(self, context_chunks: List[RetrievedChunk]) -> str:
         """Builds a JSON string representing the textual context."""
-        import json
-        
-        if not context_chunks:
-            return json.dumps({"context": []})
-            
-        context_data = []
-        for i, chunk in enumerate(context_chunks, 1):
-            image_note = ""
-            if hasattr(chunk, "image_ids") and chunk.image_ids:
-                image_note = f" [Contains {len(chunk.image_ids)} image(s)]"
-                
-            context_data.append({
-                "type": "text",
-                "source_file": chunk.doc_filename or f"Source {i}",
-                "section_title": chunk.section_title or "",
-                "pages": f"{chunk.page_start}–{chunk.page_end}",
-                "content": chunk.content,
-                "note": image_note.strip() if image_note else None
-            })
-            
-        return json.dumps({"context": context_data}, ensure_ascii=False, indent=2)
+        return _context_json(_chunk_key(self._fit_budget(context_chunks)))
 
     # ----------------------------------------------------------
     # HELPER: build multimodal context (text + tables + images meta)
     # ----------------------------------------------------------
-    @staticmethod
     def _build_multimodal_context(
+        self,
         context_chunks: List[RetrievedChunk],
         tables: Optional[List[Any]],
-        retrieved_images: Optional[List[Any]],
+        retrieved_images: Optional[List[ExtractedImage]],
         max_retrieved_images: int,
     ) -> str:
         """Builds a JSON string representing the multimodal context."""
-        import json
-        
-        context_data = {
-            "context": [],
-            "tables": [],
-            "images": []
-        }
-
-        # Text chunks
-        for i, chunk in enumerate(context_chunks, 1):
-            image_note = ""
-            if hasattr(chunk, "image_ids") and chunk.image_ids:
-                image_note = f" [Contains {len(chunk.image_ids)} image(s)]"
-                
-            context_data["context"].append({
-                "type": "text",
-                "source_file": chunk.doc_filename or f"Source {i}",
-                "section_title": chunk.section_title or "",
-                "pages": f"{chunk.page_start}–{chunk.page_end}",
-                "content": chunk.content,
-                "note": image_note.strip() if image_note else None
-            })
-
-        # Tables
-        if tables:
-            for i, table in enumerate(tables, 1):
-                if hasattr(table, "markdown_content"):
-                    content = table.markdown_content
-                    page = table.page_number
-                    title = table.section_title
-                    doc_filename = getattr(table, "doc_filename", f"Table {i}")
-                else:
-                    content = table.get("markdown", "") or str(table)
-                    page = table.get("page_number", "?")
-                    title = table.get("section_title", "")
-                    doc_filename = table.get("doc_filename", f"Table {i}")
-                    
-                context_data["tables"].append({
-                    "source_file": doc_filename,
-                    "section_title": title,
-                    "page": page,
-                    "content": content
-                })
-
-        # Image analysis summaries
-        if retrieved_images:
-            for i, img in enumerate(retrieved_images[:max_retrieved_images], 1):
-                analysis = getattr(img, "analysis", "")
-                caption = getattr(img, "caption", "") or ""
-                title = getattr(img, "section_title", "") or "Unknown section"
-                page = getattr(img, "page_number", "?")
-                doc_filename = getattr(img, "doc_filename", Path(getattr(img, "image_path", "")).name)
-
-                img_data = {
-                    "source_file": doc_filename,
-                    "section_title": title,
-                    "page": page,
-                    "image_name": Path(getattr(img, "image_path", f"Image_{i}")).name
-                }
-                
-                if caption:
-                    img_data["caption"] = caption
-                if analysis:
-                    img_data["analysis"] = analysis
-                elif not caption:
-                    img_data["note"] = "No textual analysis available — refer to the visual below."
-                    
-                context_data["images"].append(img_data)
-
-        return json.dumps(context_data, ensure_ascii=False, indent=2)
+        return _multimodal_context_json(
+            _chunk_key(self._fit_budget(context_chunks)),
+            _table_key(tables),
+            _image_key((retrieved_images or [])[:max_retrieved_images]),
+        )
 
     # ----------------------------------------------------------
     # HELPER: Log exact LLM requests and inputs
     # ----------------------------------------------------------
     def _log_llm_request(self, messages: List[Dict[str, Any]]) -> None:
-        """Write the exact LLM input payload to a dedicated log file."""
-        import json
-        import os
-        from datetime import datetime
-        
-        log_dir = self.settings.log_dir if hasattr(self.settings, 'log_dir') else "./logs"
-        os.makedirs(log_dir, exist_ok=True)
-        log_file = os.path.join(log_dir, "llm_inputs.log")
-        
+        """
+        Queue the exact LLM input payload for the dedicated log file. Dumping
+        the prompt and context to JSON and appending it runs on a background
+        thread instead of the event loop; one worker keeps entries in order.
+        """
+        self._log_queued += 1
+        _LOG_EXECUTOR.submit(self._write_llm_request, messages, datetime.utcnow())
+
+    def _write_llm_request(self, messages: List[Dict[str, Any]], timestamp: datetime) -> None:
+        """
+        Write the exact LLM input payload to a dedicated log file. Runs only
+        on the log thread, which keeps the file open across entries; each
+        entry goes out as a single buffered write.
+        """
         try:
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"\n{'='*50}\n")
-                f.write(f"TIMESTAMP: {datetime.utcnow().isoformat()}\n")
-                f.write(f"MODEL: {self.model}\n")
-                f.write(f"{'-'*50}\n")
-                
-                # We do a deepcopy or manual extraction to avoid dumping giant base64 image strings into the log
-                log_messages = []
-                for msg in messages:
-                    if isinstance(msg.get("content"), list):
-                        # This is a multimodal message
-                        safe_content = []
-                        for part in msg["content"]:
-                            if part.get("type") == "text":
+            if self._log_file is None:
+                log_dir = self.settings.log_dir if hasattr(self.settings, 'log_dir') else "./logs"
+                os.makedirs(log_dir, exist_ok=True)
+                self._log_file = open(
+                    os.path.join(log_dir, "llm_inputs.log"), "a", encoding="utf-8", buffering=1 << 20
+                )
+
+            # We do a deepcopy or manual extraction to avoid dumping giant base64 image strings into the log
+            log_messages = []
+            for msg in messages:
+                if isinstance(msg.get("content"), list):
+                    # This is a multimodal message
+                    safe_content = []
+                    for part in msg["content"]:
+                        if part.get("type") == "text":
+                            safe_content.append(part)
+                        elif part.get("type") == "image_url":
+                            url_data = part.get("image_url", {}).get("url", "")
+                            if url_data.startswith("data:image"):
+                                safe_content.append({"type": "image_url", "image_url": {"url": "<BASE64_IMAGE_DATA>"}})
+                            else:
                                 safe_content.append(part)
-                            elif part.get("type") == "image_url":
-                                url_data = part.get("image_url", {}).get("url", "")
-                                if url_data.startswith("data:image"):
-                                    safe_content.append({"type": "image_url", "image_url": {"url": "<BASE64_IMAGE_DATA>"}})
-                                else:
-                                    safe_content.append(part)
-                        log_messages.append({"role": msg.get("role"), "content": safe_content})
-                    else:
-                        # Standard text message
-                        log_messages.append({"role": msg.get("role"), "content": msg.get("content")})
-                
-                f.write(json.dumps(log_messages, indent=2, ensure_ascii=False))
-                f.write(f"\n{'='*50}\n")
+                    log_messages.append({"role": msg.get("role"), "content": safe_content})
+                else:
+                    # Standard text message
+                    log_messages.append({"role": msg.get("role"), "content": msg.get("content")})
+
+            self._log_file.write(
+                f"\n{'='*50}\n"
+                f"TIMESTAMP: {timestamp.isoformat()}\n"
+                f"MODEL: {self.model}\n"
+                f"{'-'*50}\n"
+                f"{json.dumps(log_messages, indent=2, ensure_ascii=False)}"
+                f"\n{'='*50}\n"
+            )
+            # Flush once the backlog is drained: a burst of requests shares one
+            # write syscall, and an idle log is always complete on disk
+            if self._log_written + 1 >= self._log_queued:
+                self._log_file.flush()
         except Exception as e:
             logger.error(f"Failed to log LLM request: {e}")
+        finally:
+            self._log_written += 1
+
+    def _close_log(self) -> None:
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
 
     # ----------------------------------------------------------
     # HELPER: append image blobs to user_content list
     # ----------------------------------------------------------
-    def _append_images(
+    async def _append_images(
         self,
         user_content: list,
-        retrieved_images: Optional[List[Any]],
+        retrieved_images: Optional[List[ExtractedImage]],
         user_uploaded_images: Optional[List[str]],
         max_retrieved_images: int,
         max_user_images: int,
     ) -> None:
-        if retrieved_images:
-            for img_obj in retrieved_images[:max_retrieved_images]:
-                img_path = getattr(img_obj, "image_path", "")
-                if not img_path:
-                    continue
-                try:
-                    user_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{self._resize_image(img_path)}"},
-                    })
-                except Exception as e:
-                    logger.warning(f"Could not load retrieved image {img_path}: {e}")
-
-        if user_uploaded_images:
-            for img_path in user_uploaded_images[:max_user_images]:
-                try:
-                    user_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{self._resize_image(img_path)}"},
-                    })
-                except Exception as e:
-                    logger.warning(f"Could not load user image {img_path}: {e}")
+        """
+        Append image blobs to user_content: uploaded images first, then the
+        retrieved ones behind a separator label. All images are resized and
+        encoded concurrently in worker threads, off the event loop.
+        """
+        user_paths = list((user_uploaded_images or [])[:max_user_images])
+
+        # Uploads are the subject of the question and keep full detail;
+        # retrieved figures are supplementary and go as low-detail thumbnails,
+        # precomputed at ingestion when available
+        # The same file is encoded and sent once, however often it is cited
+        seen = set()
+        jobs = []
+        duplicates = 0
+        for img_path in user_paths:
+            key = os.path.realpath(img_path)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            jobs.append(("user", img_path, "high", None))
+        for img_obj in (retrieved_images or [])[:max_retrieved_images]:
+            img_path = img_obj.image_path
+            if not img_path:
+                continue
+            key = os.path.realpath(img_path)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            jobs.append(("retrieved", img_path, "low", img_obj.thumbnail_path))
+        if duplicates:
+            logger.info(f"Skipped {duplicates} duplicate image(s) in vision payload")
+        if not jobs:
+            return
+
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(self._load_thumbnail, thumb, path)
+                if thumb else asyncio.to_thread(self._resize_image, path, detail)
+                for _, path, detail, thumb in jobs
+            ),
+            return_exceptions=True,
+        )
+
+        separated = False
+        for (kind, path, detail, _), data in zip(jobs, results):
+            if kind == "retrieved" and user_paths and not separated:
+                user_content.append({
+                    "type": "text",
+                    "text": "\n--- Reference images from documents (supplementary context) ---\n"
+                })
+                separated = True
+            if isinstance(data, BaseException) or data is None:
+                if data is not None:
+                    logger.warning(f"Could not load {kind} image {path}: {data}")
+                continue
+            user_content.append({
+                "type": "image_url",
+                "image_url": {"url": _DETAIL_DATA_URL_PREFIX[detail] + data, "detail": detail},
+            })
 
     # ==========================================================
     # PUBLIC METHODS
@@ -442,34 +1249,71 @@ class LLMService:
         query: str,
         context_chunks: List[RetrievedChunk],
         system_prompt: Optional[str] = None,
+        chat_history: Optional[List[Dict[str, str]]] = None,
     ) -> str:
         """Generate a TEXT-ONLY response (no images)."""
         if not self.client:
             raise ValueError("LLM client not initialized. Check LLM_API_KEY.")
 
-        context = self._build_context(context_chunks)
         prompt = system_prompt or _BASE_RAG_SYSTEM
+        cached, cache_handle = await self._cached_answer(prompt, query, context_chunks, chat_history)
+        if cached is not None:
+            logger.info("Answered from response cache")
+            return cached
+
+        context = self._build_context(context_chunks)
 
         messages = [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"},
+            self._system_message(prompt, context),
+            *self._history_messages(chat_history),
+            {"role": "user", "content": query},
         ]
 
         # --- Logging the exact input sent to LLM ---
         self._log_llm_request(messages)
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            response = await self._complete(
+                messages,
                 temperature=self.settings.llm_temperature,
                 max_tokens=self.settings.llm_max_tokens,
             )
-            return response.choices[0].message.content
+            answer = response.choices[0].message.content
+            self._store_answer(cache_handle, answer)
+            return answer
         except Exception as e:
             logger.error(f"Error generating response: {e}")
             raise
 
+    async def batch_generate_response(
+        self,
+        batch: List[Tuple[str, List[RetrievedChunk]]],
+        system_prompt: Optional[str] = None,
+    ) -> List[Union[str, BaseException]]:
+        """
+        Run several independent text RAG calls concurrently (bounded by
+        LLM_MAX_CONCURRENCY). Results come back in input order; a failed
+        item holds its exception instead of failing the whole batch.
+        """
+        return await asyncio.gather(
+            *(self.generate_response(q, c, system_prompt) for q, c in batch),
+            return_exceptions=True,
+        )
+
+    async def batch_generate_multimodal_response(
+        self,
+        batch: List[Dict[str, Any]],
+    ) -> List[Union[str, BaseException]]:
+        """
+        Concurrent generate_multimodal_response calls; each item holds that
+        method's keyword arguments. Same ordering and error semantics as
+        batch_generate_response.
+        """
+        return await asyncio.gather(
+            *(self.generate_multimodal_response(**kwargs) for kwargs in batch),
+            return_exceptions=True,
+        )
+
     async def generate_direct_response(
         self,
         query: str,
@@ -480,7 +1324,7 @@ class LLMService:
             raise ValueError("LLM client not initialized")
 
         messages = [
-            {"role": "system", "content": system_prompt or _DIRECT_RESPONSE_SYSTEM},
+            self._system_message(system_prompt or _DIRECT_RESPONSE_SYSTEM),
             {"role": "user", "content": query},
         ]
 
@@ -488,9 +1332,8 @@ class LLMService:
         self._log_llm_request(messages)
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            response = await self._complete(
+                messages,
                 temperature=self.settings.llm_temperature,
                 max_tokens=self.settings.llm_max_tokens,
             )
@@ -504,7 +1347,7 @@ class LLMService:
         query: str,
         context_chunks: List[RetrievedChunk],
         tables: Optional[List[Any]] = None,
-        retrieved_images: Optional[List[Any]] = None,
+        retrieved_images: Optional[List[ExtractedImage]] = None,
         user_uploaded_images: Optional[List[str]] = None,
         chat_history: Optional[List[Dict[str, str]]] = None,
         max_retrieved_images: int = 3,
@@ -513,6 +1356,10 @@ class LLMService:
         if not self.client:
             raise ValueError("LLM client not initialized")
 
+        # Nothing visual to send: plain text RAG, without the vision scaffolding
+        if not (retrieved_images or user_uploaded_images or tables):
+            return await self.generate_response(query, context_chunks, chat_history=chat_history)
+
         has_user_images = bool(user_uploaded_images)
         
         context_text = self._build_multimodal_context(
@@ -522,68 +1369,34 @@ class LLMService:
         # --- KEY CHANGE: Split prompt structure based on whether user uploaded images ---
         if has_user_images:
             system_prompt = _USER_IMAGE_ANALYSIS_SYSTEM
-            text_parts = [
-                f"## Uploaded Images for Analysis\n"
-                f"The user has uploaded {len(user_uploaded_images)} image(s). "
-                f"These are shown below and are the PRIMARY subject of the question.\n",
-                f"## Reference Context (Supplementary)\n{context_text}\n",
-                f"## User Question\n{query}"
-            ]
+            user_text = _UPLOADED_IMAGES_USER.format(n_images=len(user_uploaded_images), query=query)
         else:
             system_prompt = _BASE_MULTIMODAL_SYSTEM
-            text_parts = [
-                f"Context:\n{context_text}\n",
-                f"Question: {query}"
-            ]
+            user_text = query
 
-        user_content: list = [{"type": "text", "text": "\n".join(text_parts)}]
+        user_content: list = [{"type": "text", "text": user_text}]
 
-        # --- KEY CHANGE: Uploaded images go FIRST, retrieved images go AFTER ---
-        if has_user_images:
-            for img_path in user_uploaded_images[:max_user_images]:
-                try:
-                    user_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{self._resize_image(img_path)}"},
-                    })
-                except Exception as e:
-                    logger.warning(f"Could not load user image {img_path}: {e}")
+        # Uploaded images go FIRST, retrieved images go AFTER
+        await self._append_images(
+            user_content, retrieved_images, user_uploaded_images, max_retrieved_images, max_user_images
+        )
 
-            # Retrieved images added AFTER with a separator label
-            if retrieved_images:
-                user_content.append({
-                    "type": "text",
-                    "text": "\n--- Reference images from documents (supplementary context) ---\n"
-                })
-                for img_obj in retrieved_images[:max_retrieved_images]:
-                    img_path = getattr(img_obj, "image_path", "")
-                    if not img_path:
-                        continue
-                    try:
-                        user_content.append({
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{self._resize_image(img_path)}"},
-                        })
-                    except Exception as e:
-                        logger.warning(f"Could not load retrieved image {img_path}: {e}")
-        else:
-            # Original behavior when no user images
-            self._append_images(user_content, retrieved_images, None, max_retrieved_images, max_user_images)
+        # Shared by the vision call and the text-only fallback
+        history = self._history_messages(chat_history)
 
-        messages = [{"role": "system", "content": system_prompt}]
-        if chat_history:
-            for msg in chat_history:
-                messages.append({"role": msg["role"], "content": msg["content"]})
-        messages.append({"role": "user", "content": user_content})
+        messages = [
+            self._system_message(system_prompt, context_text),
+            *history,
+            {"role": "user", "content": user_content},
+        ]
 
         self._log_llm_request(messages)
 
         if retrieved_images or has_user_images:
             try:
                 logger.info(f"Calling model with vision input: {self.model}")
-                response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
+                response = await self._complete(
+                    messages,
                     temperature=self.settings.llm_temperature,
                     max_tokens=self.settings.llm_max_tokens,
                 )
@@ -594,17 +1407,13 @@ class LLMService:
 
         # Fallback unchanged...
         try:
-            fallback_messages = [{"role": "system", "content": _BASE_RAG_SYSTEM}]
-            if chat_history:
-                for msg in chat_history:
-                    fallback_messages.append({"role": msg["role"], "content": msg["content"]})
-            fallback_messages.append({
-                "role": "user",
-                "content": f"Context:\n{context_text}\n\nNote: Images could not be rendered.\n\nQuestion: {query}"
-            })
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=fallback_messages,
+            fallback_messages = [
+                self._system_message(_BASE_RAG_SYSTEM, context_text),
+                *history,
+                {"role": "user", "content": _IMAGES_UNAVAILABLE_USER.format(query=query)},
+            ]
+            response = await self._complete(
+                fallback_messages,
                 temperature=self.settings.llm_temperature,
                 max_tokens=self.settings.llm_max_tokens,
             )
@@ -624,85 +1433,103 @@ class LLMService:
         """Generate a short 4-5 word title based on the first interaction."""
         if not self.client:
             return "New Chat"
+        return await self._title_batcher.submit(first_user_message, first_assistant_reply)
 
-        system_prompt = (
-            "You are an AI assistant specialized in summarizing conversations into highly concise titles. "
-            "Your task is to provide a 3 to 5 word title for the chat based on the user's first message to you. "
-            "RULES:\n"
-            "- Output ONLY the title itself.\n"
-            "- NO quotes, NO punctuation at the end, NO introduction.\n"
-            "- Ignore the `<think>` process, just output the final title.\n"
-            "- Do not explain your reasoning."
-        )
-        assistant_reply = ""
-        if first_assistant_reply:
-            assistant_reply = f"\nAssistant: {first_assistant_reply}"
-        prompt = (
-            f"User: {first_user_message}\n"
-            f"Assistant: {assistant_reply}\n"
-            f"Generate a concise 3-5 word title for this topic:"
-        )
-
+    async def _request_title(self, first_user_message: str, first_assistant_reply: str) -> str:
+        """One title per completion call."""
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
+            response = await self._complete(
+                [
+                    _SYS_TITLE,
+                    {"role": "user", "content": (
+                        f"{_title_exchange(first_user_message, first_assistant_reply)}\n"
+                        f"Generate a concise 3-5 word title for this topic:"
+                    )}
                 ],
                 temperature=0.2,
                 max_tokens=512,
                 extra_body={"chat_template_kwargs": {"enable_thinking": False}}  # Qwen3 specific
 
             )
-            raw_title = response.choices[0].message.content
-            
-            # Remove any <think>...</think> blocks from reasoning models
-            import re
-            cleaned_title = re.sub(r'<think>.*?(?:</think>|$)', '', raw_title, flags=re.DOTALL)
-            
-            title = cleaned_title.strip().strip('"').strip("'").strip()
-            # If the model still outputs something like "Title: ...", strip it
-            if title.lower().startswith("title:"):
-                title = title[6:].strip()
-                
-            return title if title else "New Chat"
+            return _clean_title(response.choices[0].message.content)
         except Exception as e:
             logger.error(f"Error generating chat title: {str(e)}")
             return "New Chat"
 
+    async def _request_titles(self, exchanges: List[tuple]) -> List[str]:
+        """Titles for several conversations from a single completion call."""
+        if len(exchanges) == 1:
+            return [await self._request_title(*exchanges[0])]
+
+        numbered = "\n\n".join(
+            f"{i})\n{_title_exchange(user, reply)}"
+            for i, (user, reply) in enumerate(exchanges, 1)
+        )
+        try:
+            response = await self._complete(
+                [
+                    _SYS_TITLE,
+                    {"role": "user", "content": (
+                        f"{numbered}\n\n"
+                        f"Generate a concise 3-5 word title for each of the {len(exchanges)} conversations above. "
+                        f"Return ONLY a JSON array of {len(exchanges)} strings, in the same order."
+                    )}
+                ],
+                temperature=0.2,
+                max_tokens=max(512, 48 * len(exchanges)),
+                extra_body={"chat_template_kwargs": {"enable_thinking": False}}  # Qwen3 specific
+            )
+            raw = _THINK_RE.sub("", response.choices[0].message.content or "")
+            titles = json.loads(raw[raw.index("["):raw.rindex("]") + 1])
+            if isinstance(titles, list) and len(titles) == len(exchanges):
+                return [_clean_title(str(t)) for t in titles]
+            logger.warning(f"Batched title call returned {len(titles)} titles for {len(exchanges)} chats")
+        except Exception as e:
+            logger.warning(f"Batched title call failed ({e}); generating titles one by one")
+
+        return list(await asyncio.gather(*(self._request_title(*ex) for ex in exchanges)))
 
     async def generate_response_stream(
         self,
         query: str,
         context_chunks: List[RetrievedChunk],
         system_prompt: Optional[str] = None,
+        chat_history: Optional[List[Dict[str, str]]] = None,
     ):
         """Stream a TEXT-ONLY response token-by-token."""
         if not self.client:
             raise ValueError("LLM client not initialized. Check LLM_API_KEY.")
 
-        context = self._build_context(context_chunks)
         prompt = system_prompt or _BASE_RAG_SYSTEM
+        cached, cache_handle = await self._cached_answer(prompt, query, context_chunks, chat_history)
+        if cached is not None:
+            logger.info("Answered from response cache")
+            yield cached
+            return
+
+        context = self._build_context(context_chunks)
 
         messages = [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {query}"},
+            self._system_message(prompt, context),
+            *self._history_messages(chat_history),
+            {"role": "user", "content": query},
         ]
 
         try:
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            stream = await self._complete(
+                messages,
                 temperature=self.settings.llm_temperature,
                 max_tokens=self.settings.llm_max_tokens,
                 stream=True,
             )
-            async for chunk in stream:
-                if chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        yield delta.content
+            # Only a stream that ran to completion is cached
+            parts = [] if cache_handle is not None else None
+            async for text in _coalesce_deltas(stream):
+                if parts is not None:
+                    parts.append(text)
+                yield text
+            if parts:
+                self._store_answer(cache_handle, "".join(parts))
         except Exception as e:
             logger.error(f"Error streaming response: {e}")
             raise
@@ -717,23 +1544,19 @@ class LLMService:
             raise ValueError("LLM client not initialized")
 
         messages = [
-            {"role": "system", "content": system_prompt or _DIRECT_RESPONSE_SYSTEM},
+            self._system_message(system_prompt or _DIRECT_RESPONSE_SYSTEM),
             {"role": "user", "content": query},
         ]
 
         try:
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            stream = await self._complete(
+                messages,
                 temperature=self.settings.llm_temperature,
                 max_tokens=self.settings.llm_max_tokens,
                 stream=True,
             )
-            async for chunk in stream:
-                if chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        yield delta.content
+            async for text in _coalesce_deltas(stream):
+                yield text
         except Exception as e:
             logger.error(f"Error in direct streaming: {e}")
             raise
@@ -743,7 +1566,7 @@ class LLMService:
         query: str,
         context_chunks: List[RetrievedChunk],
         tables: Optional[List[Any]] = None,
-        retrieved_images: Optional[List[Any]] = None,
+        retrieved_images: Optional[List[ExtractedImage]] = None,
         user_uploaded_images: Optional[List[str]] = None,
         chat_history: Optional[List[Dict[str, str]]] = None,
         max_retrieved_images: int = 3,
@@ -753,6 +1576,12 @@ class LLMService:
         if not self.client:
             raise ValueError("LLM client not initialized")
 
+        # Nothing visual to send: plain text RAG, without the vision scaffolding
+        if not (retrieved_images or user_uploaded_images or tables):
+            async for text in self.generate_response_stream(query, context_chunks, chat_history=chat_history):
+                yield text
+            return
+
         has_user_images = bool(user_uploaded_images)
 
         context_text = self._build_multimodal_context(
@@ -762,109 +1591,62 @@ class LLMService:
         # --- Switch prompt + structure based on whether user uploaded images ---
         if has_user_images:
             system_prompt = _USER_IMAGE_ANALYSIS_SYSTEM
-            text_parts = [
-                f"## Uploaded Images for Analysis\n"
-                f"The user has uploaded {len(user_uploaded_images)} image(s). "
-                f"These are shown below and are the PRIMARY subject of the question.\n",
-                f"## Reference Context (Supplementary)\n{context_text}\n",
-                f"## User Question\n{query}"
-            ]
+            user_text = _UPLOADED_IMAGES_USER.format(n_images=len(user_uploaded_images), query=query)
         else:
             system_prompt = _BASE_MULTIMODAL_SYSTEM
-            text_parts = [
-                f"Context:\n{context_text}\n",
-                f"Question: {query}"
-            ]
+            user_text = query
 
-        user_content: list = [{"type": "text", "text": "\n".join(text_parts)}]
+        user_content: list = [{"type": "text", "text": user_text}]
 
-        # --- Uploaded images FIRST, retrieved images AFTER with separator ---
-        if has_user_images:
-            for img_path in user_uploaded_images[:max_user_images]:
-                try:
-                    user_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{self._resize_image(img_path)}"},
-                    })
-                except Exception as e:
-                    logger.warning(f"Could not load user image {img_path}: {e}")
+        # Uploaded images go FIRST, retrieved images go AFTER
+        await self._append_images(
+            user_content, retrieved_images, user_uploaded_images, max_retrieved_images, max_user_images
+        )
 
-            if retrieved_images:
-                user_content.append({
-                    "type": "text",
-                    "text": "\n--- Reference images from documents (supplementary context) ---\n"
-                })
-                for img_obj in retrieved_images[:max_retrieved_images]:
-                    img_path = getattr(img_obj, "image_path", "")
-                    if not img_path:
-                        continue
-                    try:
-                        user_content.append({
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{self._resize_image(img_path)}"},
-                        })
-                    except Exception as e:
-                        logger.warning(f"Could not load retrieved image {img_path}: {e}")
-        else:
-            # Original behavior — no user images, only retrieved
-            self._append_images(user_content, retrieved_images, None, max_retrieved_images, max_user_images)
+        # Shared by the vision call and the text-only fallback
+        history = self._history_messages(chat_history)
 
-        messages = [{"role": "system", "content": system_prompt}]
-        if chat_history:
-            for msg in chat_history:
-                messages.append({"role": msg["role"], "content": msg["content"]})
-        messages.append({"role": "user", "content": user_content})
+        messages = [
+            self._system_message(system_prompt, context_text),
+            *history,
+            {"role": "user", "content": user_content},
+        ]
 
         self._log_llm_request(messages)
 
         if retrieved_images or has_user_images:
             try:
                 logger.info(f"Streaming multimodal response: {self.model}")
-                stream = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
+                stream = await self._complete(
+                    messages,
                     temperature=self.settings.llm_temperature,
                     max_tokens=self.settings.llm_max_tokens,
                     stream=True,
                 )
-                async for chunk in stream:
-                    if chunk.choices:
-                        delta = chunk.choices[0].delta
-                        if delta.content:
-                            yield delta.content
+                async for text in _coalesce_deltas(stream):
+                    yield text
                 return  # Vision succeeded
             except Exception as e:
                 logger.warning(f"Multimodal stream failed: {e}. Falling back to text-only.")
 
         # Fallback: text-only stream
         try:
-            fallback_messages = [{"role": "system", "content": _BASE_RAG_SYSTEM}]
-            if chat_history:
-                for msg in chat_history:
-                    fallback_messages.append({"role": msg["role"], "content": msg["content"]})
-            fallback_messages.append({
-                "role": "user",
-                "content": (
-                    f"Context:\n{context_text}\n\n"
-                    "Note: Images are referenced but could not be rendered in this mode.\n\n"
-                    f"Question: {query}"
-                )
-            })
+            fallback_messages = [
+                self._system_message(_BASE_RAG_SYSTEM, context_text),
+                *history,
+                {"role": "user", "content": _IMAGES_UNAVAILABLE_USER.format(query=query)},
+            ]
 
             self._log_llm_request(fallback_messages)
 
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=fallback_messages,
+            stream = await self._complete(
+                fallback_messages,
                 temperature=self.settings.llm_temperature,
                 max_tokens=self.settings.llm_max_tokens,
                 stream=True,
             )
-            async for chunk in stream:
-                if chunk.choices:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        yield delta.content
+            async for text in _coalesce_deltas(stream):
+                yield text
         except Exception as e:
             logger.error(f"Fallback stream also failed: {e}")
             raise
@@ -872,31 +1654,32 @@ class LLMService:
     # IMAGE UTILITIES
     # ==========================================================
 
-    def _resize_image(self, image_path: str) -> str:
-        """Load and resize image if needed, return base64 string."""
+    def _resize_image(self, image_path: str, detail: str = "high") -> Optional[str]:
+        """
+        Load and resize image if needed, return base64 string (see _DETAIL_DATA_URL_PREFIX).
+        None if the image can't be decoded; the raw file is never sent instead,
+        since an unresized original can blow past the request size limit.
+        """
         try:
-            from PIL import Image
-            import io
-
-            with Image.open(image_path) as img:
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-
-                max_width = self.settings.max_image_width
-                if img.width > max_width:
-                    ratio = max_width / img.width
-                    new_height = int(img.height * ratio)
-                    img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-                    logger.debug(f"Resized {Path(image_path).name} → {max_width}×{new_height}")
-
-                buf = io.BytesIO()
-                img.save(buf, format="png", quality=85)
-                return base64.b64encode(buf.getvalue()).decode()
-
+            return _resize_image_cached(
+                str(image_path),
+                os.path.getmtime(image_path),
+                self.settings.max_image_width,
+                detail,
+                self._image_cache_dir,
+                self._image_cache_max_bytes,
+            )
         except Exception as e:
             logger.warning(f"Error resizing image {image_path}: {e}")
-            with open(image_path, "rb") as f:
-                return base64.b64encode(f.read()).decode()
+            return None
+
+    def _load_thumbnail(self, thumbnail_path: str, image_path: str) -> Optional[str]:
+        """Base64 of a precomputed low-detail JPEG; resizes the original if it is missing."""
+        try:
+            with open(thumbnail_path, "rb") as f:
+                return b64.b64encode(f.read()).decode("ascii")
+        except OSError:
+            return self._resize_image(image_path, "low")
 
     async def analyze_image(
         self,
@@ -911,7 +1694,9 @@ class LLMService:
         if not Path(image.image_path).exists():
             return f"Image not available: {image.image_path}"
 
-        image_data = self._resize_image(image.image_path)
+        image_data = await asyncio.to_thread(self._resize_image, image.image_path)
+        if image_data is None:
+            return self._describe_without_vision(image)
 
         context_part = f"Context from surrounding document text:\n{context_text}\n\n" if context_text else ""
 
@@ -930,32 +1715,36 @@ class LLMService:
             )
 
         messages = [
-            {"role": "system", "content": _IMAGE_ANALYSIS_SYSTEM},
+            _SYS_IMAGE_ANALYSIS,
             {
                 "role": "user",
                 "content": [
                     {"type": "text", "text": prompt},
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{image_data}"},
+                        "image_url": {"url": _PNG_DATA_URL_PREFIX + image_data},
                     },
                 ],
             },
         ]
 
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            response = await self._complete(
+                messages,
                 temperature=self.settings.llm_temperature,
                 max_tokens=self.settings.llm_max_tokens,
             )
             return response.choices[0].message.content
         except Exception as e:
             logger.warning(f"Vision analysis failed: {e}")
-            if image.caption:
-                return f"Image caption: {image.caption}"
-            return f"Image on page {image.page_number} ({image.width}×{image.height} {image.image_format})"
+            return self._describe_without_vision(image)
+
+    @staticmethod
+    def _describe_without_vision(image: ExtractedImage) -> str:
+        """Fallback analysis text when the image can't go through the vision model."""
+        if image.caption:
+            return f"Image caption: {image.caption}"
+        return f"Image on page {image.page_number} ({image.width}×{image.height} {image.image_format})"
 
 
 # Global LLM service instance
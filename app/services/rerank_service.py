@@ -3,7 +3,10 @@ Rerank service using sentence-transformers Cross-Encoder.
 Improves retrieval quality by re-scoring top-k results.
 """
 from typing import List, Tuple
+from collections import OrderedDict
+import hashlib
 import logging
+import threading
 import time
 from sentence_transformers import CrossEncoder
 
@@ -11,6 +14,9 @@ from app.config.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# (query, document) pairs whose normalised score is remembered
+_SCORE_CACHE_SIZE = 8192
+
 
 class RerankService:
     """
@@ -21,6 +27,10 @@ class RerankService:
         self.settings = get_settings()
         self.model = None
         self._initialized = False
+        # Follow-up turns and re-asked questions rerank the same candidates;
+        # scores depend only on the texts, so they never go stale
+        self._scores: OrderedDict[bytes, float] = OrderedDict()
+        self._scores_lock = threading.Lock()
     
     def initialize(self) -> None:
         """Initialize the Cross-Encoder model."""
@@ -60,15 +70,39 @@ class RerankService:
             return []
         
         try:
-            # Cross-Encoder expects pairs of (query, doc)
-            pairs = [[query, doc] for doc in documents]
-            scores = self.model.predict(pairs)
-            
-            # Apply Sigmoid to normalize scores to [0, 1]
-            import numpy as np
-            normalized_scores = 1 / (1 + np.exp(-scores))
-            
-            return normalized_scores.tolist()
+            keys = [
+                hashlib.blake2b(f"{query}\x1f{doc}".encode(), digest_size=16).digest()
+                for doc in documents
+            ]
+            scores: List[float] = [0.0] * len(documents)
+            misses = []
+            with self._scores_lock:
+                for i, key in enumerate(keys):
+                    score = self._scores.get(key)
+                    if score is None:
+                        misses.append(i)
+                    else:
+                        self._scores.move_to_end(key)
+                        scores[i] = score
+
+            if misses:
+                # Cross-Encoder expects pairs of (query, doc)
+                pairs = [[query, documents[i]] for i in misses]
+                raw = self.model.predict(pairs)
+
+                # Apply Sigmoid to normalize scores to [0, 1]
+                import numpy as np
+                normalized_scores = (1 / (1 + np.exp(-raw))).tolist()
+
+                with self._scores_lock:
+                    for i, score in zip(misses, normalized_scores):
+                        scores[i] = score
+                        self._scores[keys[i]] = score
+                    while len(self._scores) > _SCORE_CACHE_SIZE:
+                        self._scores.popitem(last=False)
+                logger.debug(f"Reranked {len(misses)}/{len(documents)} documents (rest cached)")
+
+            return scores
         except Exception as e:
             logger.error(f"Reranking failed: {e}")
             return [0.0] * len(documents)
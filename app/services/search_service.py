@@ -391,12 +391,12 @@ class UnifiedSearchService:
                 embedder.initialize()
                 embedding = embedder.embed_text(query_text)
 
-            if not embedding:
+            if embedding is None or len(embedding) == 0:
                 return []
 
             results = self.qdrant_client.query_points(
                 collection_name=image_collection,
-                query=embedding,
+                query=embedding.tolist(),
                 limit=top_k,
                 query_filter=filters,
             )
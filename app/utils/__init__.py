@@ -2,6 +2,7 @@
 Utilities module for PetroRAG.
 """
 from .file_utils import save_uploaded_file, generate_unique_filename
+from .image_utils import make_thumbnail_jpeg
 from .exceptions import (
     PetroRAGException,
     DocumentNotFoundError,
@@ -14,6 +15,7 @@ from .exceptions import (
 __all__ = [
     "save_uploaded_file",
     "generate_unique_filename",
+    "make_thumbnail_jpeg",
     "PetroRAGException",
     "DocumentNotFoundError",
     "CategoryNotFoundError", 
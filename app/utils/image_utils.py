@@ -0,0 +1,20 @@
+"""
+Image helpers shared by ingestion and the LLM service.
+"""
+import io
+
+from PIL import Image
+
+
+def make_thumbnail_jpeg(img: Image.Image, max_width: int) -> bytes:
+    """
+    Low-detail JPEG of a PIL image bounded by max_width on both sides.
+    Used at query time for retrieved images and at ingestion to precompute
+    the thumbnail stored next to each extracted figure.
+    """
+    # convert() returns a copy, so the caller's image is never modified
+    img = img.convert("RGB") if img.mode != "RGB" else img.copy()
+    img.thumbnail((max_width, max_width), Image.Resampling.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=82, optimize=False)
+    return buf.getvalue()